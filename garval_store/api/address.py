@@ -1,4 +1,5 @@
 import frappe
+from garval_store.commerce_context import get_customer_address
 from garval_store.utils import get_customer_from_user
 
 
@@ -11,16 +12,9 @@ def get_address(address_id):
         if not customer_name:
             return {"success": False, "error": "Not logged in"}
 
-        address = frappe.get_doc("Address", address_id)
-
-        # Check if address belongs to customer
-        is_customer_address = False
-        for link in address.links:
-            if link.link_doctype == "Customer" and link.link_name == customer_name:
-                is_customer_address = True
-                break
-
-        if not is_customer_address:
+        # Only addresses in the customer's address book belong to them
+        address = get_customer_address(address_id, customer_name)
+        if not address:
             return {"success": False, "error": "Unauthorized"}
 
         return {
@@ -89,18 +83,12 @@ def update_address(address_id, address_title, address_line1, address_line2, city
         if not customer_name:
             return {"success": False, "error": "Not logged in"}
 
-        address = frappe.get_doc("Address", address_id)
-
         # Check if address belongs to customer
-        is_customer_address = False
-        for link in address.links:
-            if link.link_doctype == "Customer" and link.link_name == customer_name:
-                is_customer_address = True
-                break
-
-        if not is_customer_address:
+        if not get_customer_address(address_id, customer_name):
             return {"success": False, "error": "Unauthorized"}
 
+        address = frappe.get_doc("Address", address_id)
+
         # Update address fields
         address.address_title = address_title
         address.address_line1 = address_line1
@@ -131,16 +119,8 @@ def delete_address(address_id):
         if not customer_name:
             return {"success": False, "error": "Not logged in"}
 
-        address = frappe.get_doc("Address", address_id)
-
         # Check if address belongs to customer
-        is_customer_address = False
-        for link in address.links:
-            if link.link_doctype == "Customer" and link.link_name == customer_name:
-                is_customer_address = True
-                break
-
-        if not is_customer_address:
+        if not get_customer_address(address_id, customer_name):
             return {"success": False, "error": "Unauthorized"}
 
         # Delete the address (force=1 to bypass validation)
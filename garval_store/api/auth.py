@@ -1,6 +1,8 @@
 import frappe
 from frappe import _
 from frappe.utils import random_string, get_url
+from garval_store.commerce_context import clear_commerce_context, get_commerce_context
+from garval_store.emails import send_email
 from garval_store.utils import create_customer_from_signup
 
 
@@ -17,46 +19,21 @@ def login(email, password):
         login_manager.authenticate(email, password)
         login_manager.post_login()
 
-        # Check if email is verified
-        email_verified = frappe.db.get_value("User", frappe.session.user, "email_verified")
+        user = frappe.session.user
 
-        # Ensure Customer role is assigned to user
-        user = frappe.get_doc("User", frappe.session.user)
-        if "Customer" not in [role.role for role in user.roles]:
-            user.add_roles("Customer")
+        # Roles come from the cache; the User doc is only loaded for the rare account without Customer.
+        # The Stripe Settings permission is set up by a patch on migrate.
+        if "Customer" not in frappe.get_roles(user):
+            frappe.get_doc("User", user).add_roles("Customer")
             frappe.db.commit()
 
-        # Ensure Stripe Settings permission for Customer role (on first login after deployment)
-        try:
-            frappe.flags.ignore_permissions = True
-            existing_perm = frappe.db.get_value("Custom DocPerm",
-                {"parent": "Stripe Settings", "role": "Customer", "read": 1},
-                "name"
-            )
-
-            if not existing_perm:
-                perm_doc = frappe.get_doc({
-                    "doctype": "Custom DocPerm",
-                    "parent": "Stripe Settings",
-                    "parenttype": "DocType",
-                    "parentfield": "permissions",
-                    "role": "Customer",
-                    "read": 1,
-                    "permlevel": 0
-                })
-                perm_doc.insert(ignore_permissions=True)
-                frappe.db.commit()
-                frappe.clear_cache()
-        except Exception as perm_error:
-            frappe.log_error(f"Failed to setup Stripe permission: {str(perm_error)}", "Login Permission Setup")
-        finally:
-            frappe.flags.ignore_permissions = False
+        profile = get_commerce_context(user)
 
         return {
             "success": True,
-            "user": frappe.session.user,
-            "full_name": frappe.db.get_value("User", frappe.session.user, "full_name"),
-            "email_verified": bool(email_verified)
+            "user": user,
+            "full_name": profile.full_name,
+            "email_verified": bool(profile.email_verified)
         }
 
     except frappe.AuthenticationError:
@@ -125,6 +102,7 @@ def send_verification_email(email, full_name):
     # Store key in user record
     frappe.db.set_value("User", email, "email_verification_key", verification_key)
     frappe.db.set_value("User", email, "email_verified", 0)
+    clear_commerce_context(email)
     frappe.db.commit()
 
     # Build verification URL
@@ -132,53 +110,16 @@ def send_verification_email(email, full_name):
 
     # Get current language
     lang = frappe.local.lang or "es"
+    subject = "Verifica tu cuenta - Finca Garval" if lang == "es" else "Verify your account - Finca Garval"
 
-    if lang == "es":
-        subject = "Verifica tu cuenta - Finca Garval"
-        message = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: #33652B;">Bienvenido a Finca Garval</h2>
-            <p>Hola {full_name},</p>
-            <p>Gracias por registrarte. Por favor, verifica tu correo electrónico haciendo clic en el siguiente enlace:</p>
-            <p style="margin: 30px 0;">
-                <a href="{verification_url}" style="background-color: #33652B; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; display: inline-block;">
-                    Verificar mi cuenta
-                </a>
-            </p>
-            <p>O copia y pega este enlace en tu navegador:</p>
-            <p style="color: #666; word-break: break-all;">{verification_url}</p>
-            <p>Este enlace expirará en 24 horas.</p>
-            <p>Si no has creado esta cuenta, puedes ignorar este correo.</p>
-            <br>
-            <p>Saludos,<br>El equipo de Finca Garval</p>
-        </div>
-        """
-    else:
-        subject = "Verify your account - Finca Garval"
-        message = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: #33652B;">Welcome to Finca Garval</h2>
-            <p>Hello {full_name},</p>
-            <p>Thank you for signing up. Please verify your email by clicking the link below:</p>
-            <p style="margin: 30px 0;">
-                <a href="{verification_url}" style="background-color: #33652B; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; display: inline-block;">
-                    Verify my account
-                </a>
-            </p>
-            <p>Or copy and paste this link into your browser:</p>
-            <p style="color: #666; word-break: break-all;">{verification_url}</p>
-            <p>This link will expire in 24 hours.</p>
-            <p>If you didn't create this account, you can ignore this email.</p>
-            <br>
-            <p>Best regards,<br>The Finca Garval Team</p>
-        </div>
-        """
-
-    frappe.sendmail(
+    send_email(
         recipients=[email],
         subject=subject,
-        message=message,
-        now=True
+        template="verify_email",
+        context={"full_name": full_name, "verification_url": verification_url},
+        lang=lang,
+        reference_doctype="User",
+        reference_name=email
     )
 
 
@@ -224,6 +165,7 @@ def verify_email(key, email):
 
         # Mark email as verified
         frappe.db.set_value("User", email, "email_verified", 1)
+        clear_commerce_context(email)
         frappe.db.set_value("User", email, "email_verification_key", None)
         frappe.db.commit()
 
@@ -283,9 +225,8 @@ def check_email_verified():
     if frappe.session.user == "Guest":
         return {"verified": False, "is_guest": True}
 
-    is_verified = frappe.db.get_value("User", frappe.session.user, "email_verified")
     return {
-        "verified": bool(is_verified),
+        "verified": get_commerce_context().email_verified,
         "is_guest": False
     }
 
@@ -300,6 +241,7 @@ def update_profile(full_name, phone=None):
 
         # Update User
         frappe.db.set_value("User", user, "full_name", full_name)
+        clear_commerce_context(user)
 
         # Update Customer if exists
         from garval_store.utils import get_customer_from_user
@@ -0,0 +1,93 @@
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import flt
+from garval_store.utils import (
+    MAX_QUANTITY_PER_ITEM,
+    calculate_taxes_and_charges,
+    format_currency,
+    load_cart_items,
+    validate_cart_line
+)
+
+
+@frappe.whitelist(allow_guest=True)
+def reprice(items, country=None, postal_code=None, shipping_service=None):
+    """Validate and reprice a whole localStorage cart in one call.
+
+    Uses the same checks as order creation, so problems show up in the cart
+    instead of failing at checkout. Returns per-line price, availability and
+    maximum quantity, plus totals with a tax preview for the valid lines.
+    With a destination country, also returns the shipping options for the cart,
+    and the totals charge the chosen `shipping_service` (or the cheapest).
+    """
+    try:
+        if isinstance(items, str):
+            items = json.loads(items)
+
+        cart_lines = [
+            (item.get("id") or item.get("item_code"), flt(item.get("quantity", 1)))
+            for item in items or []
+        ]
+        cart_lines = [(item_code, qty) for item_code, qty in cart_lines if item_code]
+        cart_items = load_cart_items([item_code for item_code, _qty in cart_lines])
+
+        lines = []
+        subtotal = 0
+        for item_code, qty in cart_lines:
+            cart_item = cart_items.get(item_code)
+            error = validate_cart_line(item_code, qty, cart_item)
+            price = cart_item.rate if cart_item else 0
+            amount = price * qty if not error else 0
+            subtotal += amount
+
+            lines.append({
+                "item_code": item_code,
+                "qty": qty,
+                "price": price,
+                "formatted_price": cart_item.formatted_price if cart_item else format_currency(0),
+                "amount": amount,
+                "available": not error,
+                "in_stock": bool(cart_item and cart_item.stock.in_stock),
+                "max_qty": get_max_qty(cart_item),
+                "error": error
+            })
+
+        shipping_rates = []
+        shipping_rate = None
+        if country:
+            from garval_store.shipping import get_cart_weight, get_rates, select_rate
+            weight = get_cart_weight(cart_lines, cart_items)
+            shipping_rates = get_rates(country, postal_code, weight)
+            shipping_rate = select_rate(shipping_rates, shipping_service)
+
+        totals = calculate_taxes_and_charges(subtotal, shipping_rate=shipping_rate)
+
+        return {
+            "success": True,
+            "items": lines,
+            "shipping_rates": shipping_rates,
+            "shipping_rate": shipping_rate,
+            **totals,
+            "formatted_subtotal": format_currency(totals["subtotal"]),
+            "formatted_grand_total": format_currency(totals["grand_total"])
+        }
+
+    except Exception as e:
+        frappe.log_error(f"Cart reprice error: {str(e)}")
+        return {
+            "success": False,
+            "error": _("Could not update cart prices. Please try again.")
+        }
+
+
+def get_max_qty(cart_item):
+    """Largest quantity of an item a cart line may hold"""
+    if not cart_item:
+        return 0
+
+    stock = cart_item.stock
+    if stock.actual_qty is None or cart_item.on_backorder:
+        return MAX_QUANTITY_PER_ITEM
+    return max(0, min(MAX_QUANTITY_PER_ITEM, int(stock.actual_qty)))
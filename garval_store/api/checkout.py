@@ -1,10 +1,15 @@
 import frappe
 from frappe import _
-from garval_store.utils import create_sales_order_from_cart, calculate_taxes_and_charges, format_currency
+from garval_store.emails import send_email
+from garval_store.utils import create_sales_order_from_cart, calculate_taxes_and_charges, calculate_taxes_for_subtotals, format_currency
 
 @frappe.whitelist(allow_guest=True)
-def create_order(customer_info, items, total):
-    """Create ERPNext Sales Order from checkout"""
+def create_order(customer_info, items, total, idempotency_key=None):
+    """Create ERPNext Sales Order from checkout.
+
+    Retries with the same Idempotency-Key (header or param) return the
+    original order instead of creating another one.
+    """
     try:
         if isinstance(customer_info, str):
             import json
@@ -13,27 +18,17 @@ def create_order(customer_info, items, total):
             import json
             items = json.loads(items)
 
-        cart_data = {
-            "items": items,
-            "total": float(total)
-        }
-
-        result = create_sales_order_from_cart(cart_data, customer_info)
+        from garval_store.idempotency import get_idempotency_key, run_idempotent
 
-        if result.get("success"):
-            # Order confirmation email is now sent when payment is marked as paid
-            # Invoice email with bank details is sent via Payment Request on submit
-            return {
-                "success": True,
-                "order_id": result.get("order_id"),
-                "payment_url": result.get("payment_url"),
-                "message": _("Order placed successfully")
-            }
-        else:
-            return {
-                "success": False,
-                "error": result.get("error", _("Failed to create order"))
-            }
+        return run_idempotent(
+            "create_order",
+            get_idempotency_key(idempotency_key),
+            _create_order,
+            customer_info,
+            items,
+            total,
+            fingerprint=[customer_info, items]
+        )
 
     except Exception as e:
         frappe.log_error(f"Create order error: {str(e)}")
@@ -42,6 +37,66 @@ def create_order(customer_info, items, total):
             "error": _("Failed to process order. Please try again.")
         }
 
+def _create_order(customer_info, items, total):
+    cart_data = {
+        "items": items,
+        "total": float(total)
+    }
+
+    result = create_sales_order_from_cart(cart_data, customer_info)
+
+    if result.get("success"):
+        # Order confirmation email is now sent when payment is marked as paid
+        # Invoice email with bank details is sent via Payment Request on submit
+        from garval_store.order_view import make_order_view_token
+
+        return {
+            "success": True,
+            "order_id": result.get("order_id"),
+            # Lets the confirmation page show the order, including to guests
+            "view_token": make_order_view_token(result.get("order_id")),
+            "payment_url": result.get("payment_url"),
+            "payment_pending": result.get("payment_pending"),
+            "message": _("Order placed successfully")
+        }
+    else:
+        return {
+            "success": False,
+            "error": result.get("error", _("Failed to create order"))
+        }
+
+@frappe.whitelist()
+def get_order_status(order_id):
+    """Poll the background payment pipeline of a new order"""
+    try:
+        from garval_store.order_pipeline import PIPELINE_DONE, get_pipeline_status
+        from garval_store.utils import get_customer_from_user
+
+        customer = get_customer_from_user()
+        if not customer or frappe.db.get_value("Sales Order", order_id, "customer") != customer:
+            return {"success": False, "error": _("You don't have permission to access this order")}
+
+        pipeline = get_pipeline_status(order_id)
+        if not pipeline:
+            # Orders without online payment have nothing to wait for
+            return {"success": True, "status": "Completed", "done": True, "payment_url": None}
+
+        return {
+            "success": True,
+            "status": pipeline.status,
+            "done": pipeline.status in PIPELINE_DONE,
+            "failed": pipeline.status == "Failed",
+            "payment_url": pipeline.payment_url,
+            "error": pipeline.error
+        }
+
+    except Exception as e:
+        frappe.log_error(f"Order status error: {str(e)}")
+        return {
+            "success": False,
+            "error": _("Failed to get order status. Please try again.")
+        }
+
 def send_order_confirmation(order_id, email):
     """Send order confirmation email"""
     try:
@@ -49,82 +104,44 @@ def send_order_confirmation(order_id, email):
 
         subject = _("Order Confirmation - {0}").format(order_id)
 
-        message = f"""
-        <h2>{_('Thank you for your order!')}</h2>
-        <p>{_('Your order')} <strong>{order_id}</strong> {_('has been received.')}</p>
-
-        <h3>{_('Order Details')}</h3>
-        <table style="width: 100%; border-collapse: collapse;">
-            <tr style="background: #f5f5f5;">
-                <th style="padding: 10px; text-align: left;">{_('Product')}</th>
-                <th style="padding: 10px; text-align: right;">{_('Qty')}</th>
-                <th style="padding: 10px; text-align: right;">{_('Price')}</th>
-            </tr>
-        """
-
-        for item in order.items:
-            message += f"""
-            <tr>
-                <td style="padding: 10px; border-bottom: 1px solid #ddd;">{item.item_name}</td>
-                <td style="padding: 10px; border-bottom: 1px solid #ddd; text-align: right;">{item.qty}</td>
-                <td style="padding: 10px; border-bottom: 1px solid #ddd; text-align: right;">{format_currency(item.amount)}</td>
-            </tr>
-            """
-
-        message += f"""
-        </table>
-
-        <p style="margin-top: 20px; font-size: 18px;">
-            <strong>{_('Total')}: {format_currency(order.grand_total)}</strong>
-        </p>
-
-        <p>{_('We will notify you when your order ships.')}</p>
-
-        <p>{_('Best regards,')}<br>Finca Garval</p>
-        """
-
-        frappe.sendmail(
+        send_email(
             recipients=[email],
             subject=subject,
-            message=message,
-            now=True
+            template="order_confirmation",
+            context={
+                "order_id": order_id,
+                "items": [
+                    {"item_name": item.item_name, "qty": item.qty, "amount": format_currency(item.amount)}
+                    for item in order.items
+                ],
+                "total": format_currency(order.grand_total)
+            },
+            reference_doctype="Sales Order",
+            reference_name=order_id
         )
 
     except Exception as e:
         frappe.log_error(f"Order email error: {str(e)}")
 
 @frappe.whitelist(allow_guest=True)
-def get_shipping_rates(country, postal_code=None):
-    """Get shipping rates based on location"""
+def get_shipping_rates(country, postal_code=None, items=None):
+    """Get shipping rates based on location and, when items are passed, the cart weight"""
     try:
-        # Simple shipping logic - can be extended
-        shipping_rates = {
-            "Spain": {"standard": 0, "express": 5.99},  # Free shipping in Spain
-            "Portugal": {"standard": 4.99, "express": 9.99},
-            "France": {"standard": 7.99, "express": 14.99},
-            "Germany": {"standard": 9.99, "express": 17.99},
-            "Italy": {"standard": 9.99, "express": 17.99},
-            "default": {"standard": 14.99, "express": 24.99}
-        }
-
-        rates = shipping_rates.get(country, shipping_rates["default"])
+        from garval_store.shipping import get_cart_weight, get_rates
+
+        weight = 0
+        if items:
+            if isinstance(items, str):
+                import json
+                items = json.loads(items)
+            weight = get_cart_weight([
+                (item.get("id") or item.get("item_code"), float(item.get("quantity", 1)))
+                for item in items
+            ])
 
         return {
             "success": True,
-            "rates": [
-                {
-                    "id": "standard",
-                    "name": _("Standard Shipping"),
-                    "price": rates["standard"],
-                    "days": "5-7"
-                },
-                {
-                    "id": "express",
-                    "name": _("Express Shipping"),
-                    "price": rates["express"],
-                    "days": "2-3"
-                }
-            ]
+            "rates": get_rates(country, postal_code, weight)
         }
 
     except Exception as e:
@@ -149,3 +166,30 @@ def calculate_taxes(subtotal):
             "success": False,
             "error": str(e)
         }
+
+# Most subtotals one calculate_taxes_batch call accepts (it is open to guests)
+MAX_TAX_SUBTOTALS = 50
+
+@frappe.whitelist(allow_guest=True)
+def calculate_taxes_batch(subtotals):
+    """Calculate taxes and charges for several subtotals in one call"""
+    try:
+        if isinstance(subtotals, str):
+            import json
+            subtotals = json.loads(subtotals)
+        if len(subtotals) > MAX_TAX_SUBTOTALS:
+            return {
+                "success": False,
+                "error": _("Too many subtotals; send at most {0} per request").format(MAX_TAX_SUBTOTALS)
+            }
+        subtotals = [float(subtotal) for subtotal in subtotals]
+        return {
+            "success": True,
+            "results": calculate_taxes_for_subtotals(subtotals)
+        }
+    except Exception as e:
+        frappe.log_error(f"Calculate taxes error: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
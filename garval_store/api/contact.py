@@ -1,5 +1,7 @@
 import frappe
 from frappe import _
+from garval_store.emails import send_email
+from garval_store.utils import get_store_settings
 
 @frappe.whitelist(allow_guest=True)
 def submit(full_name, email, subject, message, phone=None):
@@ -17,7 +19,7 @@ def submit(full_name, email, subject, message, phone=None):
         admin_email = None
         try:
             # Get default company
-            default_company = frappe.db.get_single_value("Global Defaults", "default_company")
+            default_company = get_store_settings().company
             
             if default_company:
                 # Try to get company email first
@@ -32,18 +34,11 @@ def submit(full_name, email, subject, message, phone=None):
         # Send notification email to admin
         if admin_email:
             try:
-                frappe.sendmail(
+                send_email(
                     recipients=[admin_email],
                     subject=f"[Finca Garval] New Contact Form: {subject}",
-                    message=f"""
-                        <h3>New Contact Form Submission</h3>
-                        <p><strong>From:</strong> {full_name} ({email})</p>
-                        <p><strong>Phone:</strong> {phone or 'Not provided'}</p>
-                        <p><strong>Subject:</strong> {subject}</p>
-                        <hr>
-                        <p>{message}</p>
-                    """,
-                    now=True
+                    template="contact_notification",
+                    context={"full_name": full_name, "email": email, "phone": phone, "subject": subject, "message": message}
                 )
             except Exception as email_error:
                 # Log but don't fail if notification email fails
@@ -51,19 +46,11 @@ def submit(full_name, email, subject, message, phone=None):
 
         # Send confirmation to sender
         try:
-            frappe.sendmail(
+            send_email(
                 recipients=[email],
                 subject=_("We received your message - Finca Garval"),
-                message=f"""
-                    <p>{_('Dear')} {full_name},</p>
-                    <p>{_('Thank you for contacting us. We have received your message and will get back to you shortly.')}</p>
-                    <p><strong>{_('Your message:')}</strong></p>
-                    <blockquote style="background: #f5f5f5; padding: 15px; border-left: 3px solid #33652B;">
-                        {message}
-                    </blockquote>
-                    <p>{_('Best regards,')}<br>Finca Garval</p>
-                """,
-                now=True
+                template="contact_confirmation",
+                context={"full_name": full_name, "message": message}
             )
         except Exception as email_error:
             # Log but don't fail if confirmation email fails
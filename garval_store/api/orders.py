@@ -4,10 +4,12 @@ from garval_store.utils import get_customer_from_user
 
 
 @frappe.whitelist(allow_guest=False)
-def get_payment_url(order_id):
+def get_payment_url(order_id, idempotency_key=None):
     """
     Get or create payment URL for an existing Sales Order.
     Returns the payment URL so user can pay for "To Pay" orders.
+    Concurrent calls for the same order wait for the first one instead of
+    creating duplicate invoices and payment requests.
     """
     try:
         # Get the Sales Order
@@ -22,10 +24,36 @@ def get_payment_url(order_id):
         if so.status != "To Pay":
             return {"success": False, "error": _("This order is not in 'To Pay' status")}
 
+        from garval_store.idempotency import get_idempotency_key, run_idempotent
+
+        return run_idempotent(
+            "get_payment_url",
+            get_idempotency_key(idempotency_key),
+            _get_payment_url,
+            so,
+            fingerprint=order_id,
+            ttl=10 * 60
+        )
+
+    except Exception as e:
+        frappe.log_error(f"Error getting payment URL: {str(e)}\nOrder: {order_id}\nTraceback: {frappe.get_traceback()}", "Get Payment URL Error")
+        return {"success": False, "error": _("Failed to get payment link. Please try again or contact support.")}
+
+
+def _get_payment_url(so):
+    from garval_store.idempotency import order_lock
+    from garval_store.order_pipeline import PIPELINE_DONE, get_pipeline_status
+
+    with order_lock(so.name):
+        # The checkout pipeline is still creating the invoice and payment request
+        pipeline = get_pipeline_status(so.name)
+        if pipeline and pipeline.status not in PIPELINE_DONE:
+            return {"success": False, "pending": True, "error": _("Your payment is still being prepared. Please try again in a moment.")}
+
         # Step 1: Check if Sales Invoice exists, if not create it
         existing_invoice = frappe.db.get_value(
             "Sales Invoice Item",
-            {"sales_order": order_id, "docstatus": 1},
+            {"sales_order": so.name, "docstatus": 1},
             "parent",
             order_by="creation desc"
         )
@@ -33,7 +61,7 @@ def get_payment_url(order_id):
         if not existing_invoice:
             # Create Sales Invoice from Sales Order
             from erpnext.selling.doctype.sales_order.sales_order import make_sales_invoice
-            si_doc = make_sales_invoice(order_id, ignore_permissions=True)
+            si_doc = make_sales_invoice(so.name, ignore_permissions=True)
             si_doc.insert(ignore_permissions=True)
             si_doc.flags.ignore_permissions = True
             si_doc.submit()
@@ -118,24 +146,113 @@ def get_payment_url(order_id):
             "payment_url": payment_url
         }
 
+
+@frappe.whitelist(allow_guest=False)
+def get_order_history(cursor=None, limit=None):
+    """
+    Get a page of the current customer's orders, newest first.
+    Pass the returned next_cursor to get the following page. `html` holds the
+    rows rendered like the My Account orders table.
+    """
+    try:
+        from garval_store.order_history import ORDER_HISTORY_PAGE_SIZE, get_order_history as get_history
+        from garval_store.utils import get_currency_symbol, set_lang
+
+        set_lang()
+        history = get_history(get_customer_from_user(), cursor, limit or ORDER_HISTORY_PAGE_SIZE)
+        currency_symbol = get_currency_symbol()
+
+        return {
+            "success": True,
+            "orders": history["orders"],
+            "next_cursor": history["next_cursor"],
+            "html": "".join(
+                frappe.render_template(
+                    "templates/includes/order_row.html",
+                    {"order": order, "currency_symbol": currency_symbol}
+                )
+                for order in history["orders"]
+            )
+        }
+
     except Exception as e:
-        frappe.log_error(f"Error getting payment URL: {str(e)}\nOrder: {order_id}\nTraceback: {frappe.get_traceback()}", "Get Payment URL Error")
-        return {"success": False, "error": _("Failed to get payment link. Please try again or contact support.")}
+        frappe.log_error(f"Order history error: {str(e)}")
+        return {"success": False, "error": _("Failed to load orders. Please try again.")}
+
+
+@frappe.whitelist(allow_guest=False)
+def prepare_invoice(order_id):
+    """
+    Prepare the invoice PDF of an order for download.
+    The PDF is rendered in the background; call again until `ready` is set,
+    then open `download_url`.
+    """
+    try:
+        invoice = _get_order_invoice(order_id)
+        if not invoice:
+            return {"success": False, "error": _("This order has no invoice yet")}
+
+        from garval_store.pdf import enqueue_pdf
+        from garval_store.utils import get_lang
+
+        ready = enqueue_pdf("Sales Invoice", invoice, lang=get_lang())
+        return {
+            "success": True,
+            "ready": ready,
+            "download_url": f"/api/method/garval_store.api.orders.download_invoice?order_id={order_id}" if ready else None
+        }
+
+    except Exception as e:
+        frappe.log_error(f"Error preparing invoice: {str(e)}\nOrder: {order_id}", "Invoice Download Error")
+        return {"success": False, "error": _("Failed to prepare the invoice. Please try again.")}
+
+
+@frappe.whitelist(allow_guest=False)
+def download_invoice(order_id):
+    """Download the invoice PDF of an order, once prepare_invoice reports it ready"""
+    from garval_store.pdf import get_cached_pdf
+    from garval_store.utils import get_lang
+
+    invoice = _get_order_invoice(order_id)
+    if not invoice:
+        frappe.throw(_("This order has no invoice yet"), frappe.DoesNotExistError)
+
+    pdf = get_cached_pdf("Sales Invoice", invoice, lang=get_lang())
+    if pdf is None:
+        frappe.throw(_("The invoice is still being prepared. Please try again in a moment."))
+
+    frappe.local.response.filename = f"{invoice}.pdf"
+    frappe.local.response.filecontent = pdf
+    frappe.local.response.type = "download"
+
+
+def _get_order_invoice(order_id):
+    """Latest submitted Sales Invoice of one of the current customer's orders"""
+    customer = get_customer_from_user()
+    if not customer or frappe.db.get_value("Sales Order", order_id, "customer") != customer:
+        frappe.throw(_("You don't have permission to access this order"), frappe.PermissionError)
+
+    return frappe.db.get_value(
+        "Sales Invoice Item",
+        {"sales_order": order_id, "docstatus": 1},
+        "parent",
+        order_by="creation desc"
+    )
 
 
 @frappe.whitelist(allow_guest=False)
 def cancel_order(order_id):
     """
-    Cancel an unpaid Sales Order using Frappe's linked documents cancellation API.
-    This properly handles canceling all linked documents (Payment Requests, etc.)
+    Request cancellation of an unpaid Sales Order.
+    Its Payment Requests, Sales Invoices and the order itself are cancelled by a
+    background job; poll get_cancellation_status until it is no longer pending.
     """
     try:
-        # Get the Sales Order
-        so = frappe.get_doc("Sales Order", order_id)
+        so = frappe.db.get_value("Sales Order", order_id, ["customer", "status", "docstatus"], as_dict=True)
 
         # Verify the order belongs to the current user
         customer = get_customer_from_user()
-        if not customer or so.customer != customer:
+        if not so or not customer or so.customer != customer:
             return {"success": False, "error": _("You don't have permission to cancel this order")}
 
         # Check if order is already completed or cancelled
@@ -146,72 +263,55 @@ def cancel_order(order_id):
         if so.docstatus != 1:
             return {"success": False, "error": _("Only submitted orders can be cancelled")}
 
-        # Check if payment has been made
-        payment_entries = frappe.get_all("Payment Entry Reference",
-            filters={
-                "reference_doctype": "Sales Order",
-                "reference_name": order_id,
-                "docstatus": 1
-            },
-            fields=["parent"]
-        )
+        from garval_store.order_cancellation import get_cancellation_chain, request_cancellation
+        from garval_store.order_pipeline import PIPELINE_DONE, get_pipeline_status
 
-        if payment_entries:
+        # The checkout pipeline is still creating the invoice and payment request
+        pipeline = get_pipeline_status(order_id)
+        if pipeline and pipeline.status not in PIPELINE_DONE:
+            return {"success": False, "error": _("Your payment is still being prepared. Please try again in a moment.")}
+
+        # Check if payment has been made against the order or its invoices
+        references = [name for doctype, name in get_cancellation_chain(order_id) if doctype != "Payment Request"]
+        if frappe.db.exists("Payment Entry Reference", {"reference_name": ["in", references], "docstatus": 1}):
             return {"success": False, "error": _("Cannot cancel a paid order. Please contact support.")}
 
-        # First cancel all linked Payment Requests manually
-        payment_requests = frappe.get_all(
-            "Payment Request",
-            filters={
-                "reference_doctype": "Sales Order",
-                "reference_name": order_id,
-                "docstatus": 1  # Only submitted ones
-            },
-            fields=["name"]
-        )
-        
-        # Cancel each Payment Request individually and commit
-        for pr in payment_requests:
-            try:
-                pr_doc = frappe.get_doc("Payment Request", pr.name)
-                if pr_doc.docstatus == 1:
-                    pr_doc.cancel()
-                    frappe.db.commit()
-            except Exception as pr_error:
-                frappe.log_error(f"Error cancelling Payment Request {pr.name}: {str(pr_error)}", "Cancel Order Warning")
-                # Continue anyway
-        
-        # Clear cache to ensure links are updated
-        frappe.clear_cache()
-        
-        # Reload Sales Order to get latest state
-        so.reload()
-        
-        # Now cancel the Sales Order itself
-        if so.docstatus == 1:  # Only if still submitted
-            try:
-                so.cancel()
-                frappe.db.commit()
-            except Exception as cancel_error:
-                frappe.log_error(f"Error cancelling Sales Order: {str(cancel_error)}\nTraceback: {frappe.get_traceback()}", "Cancel Order Error")
-                # Try one more time after clearing cache
-                frappe.clear_cache()
-                so.reload()
-                if so.docstatus == 1:
-                    so.cancel()
-                    frappe.db.commit()
-        
-        # Verify cancellation
-        so.reload()
-        if so.docstatus != 2:
-            frappe.log_error(f"Sales Order {order_id} was not cancelled properly. Docstatus: {so.docstatus}", "Cancel Order Error")
-            return {"success": False, "error": _("Order cancellation failed. Please contact support.")}
+        request_cancellation(order_id)
 
         return {
             "success": True,
-            "message": _("Order cancelled successfully")
+            "pending": True,
+            "message": _("Your order is being cancelled")
         }
 
     except Exception as e:
         frappe.log_error(f"Error cancelling order: {str(e)}\nOrder: {order_id}\nTraceback: {frappe.get_traceback()}", "Cancel Order Error")
         return {"success": False, "error": _("Failed to cancel order. Please try again or contact support.")}
+
+
+@frappe.whitelist(allow_guest=False)
+def get_cancellation_status(order_id):
+    """Status of an order's cancellation: Queued (pending), Cancelled or Failed"""
+    try:
+        customer = get_customer_from_user()
+        if not customer or frappe.db.get_value("Sales Order", order_id, "customer") != customer:
+            return {"success": False, "error": _("You don't have permission to access this order")}
+
+        from garval_store.order_cancellation import get_cancellation_status as get_status
+
+        cancellation = get_status(order_id)
+        if not cancellation:
+            return {"success": False, "error": _("No cancellation was requested for this order")}
+
+        if cancellation.status == "Failed":
+            return {"success": False, "status": "Failed", "error": cancellation.error}
+
+        return {
+            "success": True,
+            "status": cancellation.status,
+            "pending": cancellation.status == "Queued"
+        }
+
+    except Exception as e:
+        frappe.log_error(f"Cancellation status error: {str(e)}")
+        return {"success": False, "error": _("Failed to get order status. Please try again.")}
@@ -0,0 +1,208 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import frappe
+
+# Two-tier cache for hot storefront lookups:
+#   1. a size-bounded LRU in each worker process (no network round-trip)
+#   2. Redis, shared by all workers of the site
+# Entries carry tags. Invalidating a tag bumps its version in Redis, which
+# makes every entry stored under the previous version unreachable in both tiers.
+
+TAG_KEY = "garval_cache_tag:{0}"
+STATS_KEY = "garval_cache_stats"
+STATS_FLUSH_EVERY = 100
+
+# Document changes that invalidate cached lookups (wired through doc_events)
+CACHE_TAGS_BY_DOCTYPE = {
+    "Item Group": ["item_groups", "catalog"],
+    "Payment Gateway Account": ["payment_gateways"],
+    "Payment Gateway": ["payment_gateways"],
+    "Global Defaults": ["settings", "tax_template"],
+    "Selling Settings": ["settings"],
+    "Stock Settings": ["settings"],
+    "Price List": ["settings"],
+    "Company": ["settings", "tax_template"],
+    "Currency": ["settings"],
+    "Sales Taxes and Charges Template": ["tax_template"],
+    "Social Login Key": ["social_login"],
+    "Garval Shipping Rate": ["shipping_rates"],
+    "Shipping Rule": ["shipping_rates"],
+}
+
+# (tags, OrderedDict) per cached function, for tag invalidation
+_local_caches = []
+_local_stats = {}
+_pending_stats = {"count": 0}
+
+
+def cached(*tags, ttl=300, maxsize=256):
+    """Cache a function's result in the worker LRU and Redis.
+
+    The cache key is built from the function name and its arguments, so
+    arguments must have a stable repr. `tags` name the data the result
+    depends on; see invalidate_tags.
+
+        @cached("item_groups", ttl=3600)
+        def get_item_groups():
+            ...
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        local_cache = OrderedDict()
+        _local_caches.append((set(tags), local_cache))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            versions = get_tag_versions(tags)
+            args_key = hashlib.md5(repr((args, sorted(kwargs.items()))).encode()).hexdigest()
+            key = f"garval_cache:{name}:{versions}:{args_key}"
+            local_key = (getattr(frappe.local, "site", None), key)
+
+            # Tier 1: worker memory
+            entry = local_cache.get(local_key)
+            if entry and entry[1] > time.monotonic():
+                local_cache.move_to_end(local_key)
+                _record(name, "local_hits")
+                return copy.deepcopy(entry[0])
+
+            # Tier 2: Redis
+            value = frappe.cache().get_value(key)
+            if value is not None:
+                _record(name, "redis_hits")
+            else:
+                _record(name, "misses")
+                value = func(*args, **kwargs)
+                if value is not None:
+                    frappe.cache().set_value(key, value, expires_in_sec=ttl)
+
+            if value is not None:
+                local_cache[local_key] = (copy.deepcopy(value), time.monotonic() + ttl)
+                local_cache.move_to_end(local_key)
+                while len(local_cache) > maxsize:
+                    local_cache.popitem(last=False)
+
+            return value
+
+        wrapper.cache_name = name
+        return wrapper
+
+    return decorator
+
+
+def invalidate_tags(*tags):
+    """Invalidate every cached entry stored under any of `tags`"""
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return
+
+    cache = frappe.cache()
+    for tag in tags:
+        cache.incr(cache.make_key(TAG_KEY.format(tag)))
+
+    # Forget this request's view of the tag versions and local entries for them
+    versions = getattr(frappe.local, "garval_cache_tag_versions", None)
+    if versions:
+        for tag in tags:
+            versions.pop(tag, None)
+    for cache_tags, local_cache in _local_caches:
+        if cache_tags & set(tags):
+            local_cache.clear()
+
+
+def invalidate_doc_tags(doc, method=None):
+    """doc_events handler: invalidate the tags mapped to the document's doctype"""
+    tags = CACHE_TAGS_BY_DOCTYPE.get(doc.doctype)
+    if not tags:
+        return
+
+    invalidate_tags(*tags)
+    # Invalidate again once the change is visible to other workers, so they
+    # can't re-cache the old value between this save and the commit
+    frappe.db.after_commit.add(lambda: invalidate_tags(*tags))
+
+
+def get_tag_versions(tags):
+    """Get the current versions of `tags` as a cache key fragment.
+
+    Versions are read from Redis at most once per tag per request.
+    """
+    if not tags:
+        return ""
+
+    if getattr(frappe.local, "garval_cache_tag_versions", None) is None:
+        frappe.local.garval_cache_tag_versions = {}
+    versions = frappe.local.garval_cache_tag_versions
+
+    missing = [tag for tag in tags if tag not in versions]
+    if missing:
+        cache = frappe.cache()
+        values = cache.mget([cache.make_key(TAG_KEY.format(tag)) for tag in missing])
+        for tag, value in zip(missing, values):
+            versions[tag] = int(value or 0)
+
+    return ".".join(f"{tag}{versions[tag]}" for tag in tags)
+
+
+def _record(name, counter):
+    """Count a cache hit or miss, flushing to Redis every few events"""
+    site = getattr(frappe.local, "site", None)
+    stats = _local_stats.setdefault((site, name), {"local_hits": 0, "redis_hits": 0, "misses": 0})
+    stats[counter] += 1
+
+    _pending_stats["count"] += 1
+    if _pending_stats["count"] >= STATS_FLUSH_EVERY:
+        flush_stats()
+
+
+def flush_stats():
+    """Add this worker's unflushed counters to the site-wide counters in Redis"""
+    try:
+        site = getattr(frappe.local, "site", None)
+        cache = frappe.cache()
+        key = cache.make_key(STATS_KEY)
+        for (stats_site, name), stats in _local_stats.items():
+            if stats_site != site:
+                continue
+            for counter, value in stats.items():
+                if value:
+                    cache.hincrby(key, f"{name}|{counter}", value)
+                    stats[counter] = 0
+        _pending_stats["count"] = 0
+    except Exception:
+        # Stats are best effort and must never break a request
+        pass
+
+
+@frappe.whitelist()
+def get_cache_stats():
+    """Site-wide hit/miss counters per cached function"""
+    frappe.only_for("System Manager")
+    flush_stats()
+
+    cache = frappe.cache()
+    stats = {}
+    for field, value in (cache.hgetall(cache.make_key(STATS_KEY)) or {}).items():
+        name, counter = frappe.safe_decode(field).rsplit("|", 1)
+        stats.setdefault(name, {"local_hits": 0, "redis_hits": 0, "misses": 0})[counter] = int(value)
+
+    for name, counters in stats.items():
+        total = sum(counters.values())
+        counters["hit_ratio"] = round((counters["local_hits"] + counters["redis_hits"]) / total, 4) if total else 0
+
+    return stats
+
+
+@frappe.whitelist()
+def reset_cache_stats():
+    """Reset the site-wide counters, e.g. before a load test"""
+    frappe.only_for("System Manager")
+    site = getattr(frappe.local, "site", None)
+    for (stats_site, _name), stats in _local_stats.items():
+        if stats_site == site:
+            for counter in stats:
+                stats[counter] = 0
+    frappe.cache().delete_value(STATS_KEY)
@@ -0,0 +1,80 @@
+import click
+
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-product-cards")
+@click.option("--chunk-size", default=500, type=int, help="Number of products rebuilt per commit")
+@pass_context
+def rebuild_product_cards(context, chunk_size):
+    """Rebuild the Garval Product Card read model from Website Item / Item"""
+    import frappe
+    from garval_store.product_cards import rebuild_product_cards as rebuild
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        total = rebuild(chunk_size=chunk_size)
+        click.echo(f"Rebuilt product cards for {total} products")
+    finally:
+        frappe.destroy()
+
+
+@click.command("prerender-static-pages")
+@pass_context
+def prerender_static_pages(context):
+    """Pre-render the legal and about pages to static HTML in every language"""
+    import frappe
+    from garval_store.static_pages import prerender_static_pages as prerender
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        written = prerender()
+        click.echo(f"Pre-rendered {len(written)} static pages")
+    finally:
+        frappe.destroy()
+
+
+@click.command("benchmark-login")
+@click.option("--url", required=True, help="Site URL, e.g. https://shop.example.com")
+@click.option("--email", required=True, help="Test account email")
+@click.option("--password", required=True, help="Test account password")
+@click.option("--requests", "total", default=200, type=int, help="Number of logins")
+@click.option("--concurrency", default=20, type=int, help="Concurrent logins")
+def benchmark_login(url, email, password, total, concurrency):
+    """Measure api.auth.login latency (p50/p95/p99) under concurrent logins"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    endpoint = url.rstrip("/") + "/api/method/garval_store.api.auth.login"
+
+    def login(_i):
+        start = time.perf_counter()
+        try:
+            response = requests.post(endpoint, json={"email": email, "password": password}, timeout=30)
+            ok = response.ok and (response.json().get("message") or {}).get("success")
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, bool(ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(login, range(total)))
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(duration * 1000 for duration, _ok in results)
+    failures = sum(1 for _duration, ok in results if not ok)
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+    click.echo(f"{total} logins, concurrency {concurrency}, {total / elapsed:.1f} logins/s, {failures} failed")
+    click.echo(f"p50 {percentile(50):.0f} ms  p95 {percentile(95):.0f} ms  p99 {percentile(99):.0f} ms  max {timings[-1]:.0f} ms")
+
+
+commands = [rebuild_product_cards, prerender_static_pages, benchmark_login]
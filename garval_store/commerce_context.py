@@ -0,0 +1,163 @@
+import frappe
+
+# Who the shopper is: their Customer, email verification, name and roles.
+# Resolved once per user and kept in a Redis hash (and the request-local
+# cache in front of it), so authenticated pages and APIs read it without
+# touching the database. Entries are dropped when the User, its Customer or
+# its Contact change; code that writes these fields with frappe.db.set_value
+# (which fires no document events) calls clear_commerce_context itself.
+#
+# Dynamic Link is a child table, so its rows only change through their
+# parent Contact, whose on_update clears the linked users.
+
+COMMERCE_CONTEXT_KEY = "garval_commerce_context"
+
+
+def get_commerce_context(user=None):
+    """Commerce context of a user (the session user by default)"""
+    user = user or frappe.session.user
+    if user == "Guest":
+        return frappe._dict({
+            "user": user,
+            "customer": None,
+            "email_verified": False,
+            "full_name": None,
+            "roles": ["Guest"]
+        })
+
+    context = frappe.cache().hget(COMMERCE_CONTEXT_KEY, user, lambda: _load_commerce_context(user))
+    return frappe._dict(context)
+
+
+def _load_commerce_context(user):
+    profile = frappe.db.get_value("User", user, ["full_name", "email_verified"], as_dict=True) or {}
+    return {
+        "user": user,
+        "customer": _find_customer(user),
+        "email_verified": bool(profile.get("email_verified")),
+        "full_name": profile.get("full_name"),
+        "roles": frappe.get_roles(user)
+    }
+
+
+def _find_customer(user):
+    """Customer of a user: by email, else through the user's Contact"""
+    customer = frappe.db.get_value("Customer", {"email_id": user}, "name")
+    if not customer:
+        # Check contact
+        contact = frappe.db.get_value("Contact", {"user": user}, "name")
+        if contact:
+            links = frappe.get_all(
+                "Dynamic Link",
+                filters={"parent": contact, "parenttype": "Contact", "link_doctype": "Customer"},
+                fields=["link_name"]
+            )
+            if links:
+                customer = links[0].link_name
+
+    return customer
+
+
+def clear_commerce_context(*users):
+    """Drop the cached context of users, now and again once the change is committed"""
+    users = [user for user in users if user and user != "Guest"]
+    if not users:
+        return
+
+    frappe.cache().hdel(COMMERCE_CONTEXT_KEY, users)
+    # Other workers could re-cache the old values until the change is committed
+    frappe.db.after_commit.add(lambda: frappe.cache().hdel(COMMERCE_CONTEXT_KEY, users))
+
+
+def on_user_change(doc, method=None):
+    """doc_events handler for User"""
+    clear_commerce_context(doc.name)
+
+
+def on_customer_change(doc, method=None):
+    """doc_events handler for Customer: clear its users, by email and through linked Contacts"""
+    users = [doc.get("email_id")]
+    before = doc.get_doc_before_save() if method != "on_trash" else None
+    if before:
+        users.append(before.get("email_id"))
+
+    contacts = frappe.get_all(
+        "Dynamic Link",
+        filters={"link_doctype": "Customer", "link_name": doc.name, "parenttype": "Contact"},
+        pluck="parent"
+    )
+    if contacts:
+        users += frappe.get_all("Contact", filters={"name": ["in", contacts], "user": ["is", "set"]}, pluck="user")
+
+    clear_commerce_context(*set(users))
+
+
+def on_contact_change(doc, method=None):
+    """doc_events handler for Contact (including its Dynamic Link rows)"""
+    users = [doc.get("user")]
+    before = doc.get_doc_before_save() if method != "on_trash" else None
+    if before:
+        users.append(before.get("user"))
+
+    clear_commerce_context(*set(users))
+
+
+# Address book: all addresses linked to a Customer, read with one join and
+# cached per customer next to the commerce context. Address changes (from
+# api.address or the desk) clear it through doc_events.
+
+ADDRESS_BOOK_KEY = "garval_address_book"
+ADDRESS_FIELDS = (
+    "name", "address_title", "address_type", "address_line1", "address_line2",
+    "city", "state", "pincode", "country", "phone"
+)
+
+
+def get_address_book(customer=None):
+    """Addresses of a customer (the session user's by default), oldest first"""
+    customer = customer or get_commerce_context().customer
+    if not customer:
+        return []
+
+    addresses = frappe.cache().hget(ADDRESS_BOOK_KEY, customer, lambda: _load_address_book(customer))
+    return [frappe._dict(address) for address in addresses]
+
+
+def get_customer_address(address_id, customer=None):
+    """One address from a customer's address book, or None if it isn't theirs"""
+    return next((address for address in get_address_book(customer) if address.name == address_id), None)
+
+
+def _load_address_book(customer):
+    address = frappe.qb.DocType("Address")
+    link = frappe.qb.DocType("Dynamic Link")
+    return (
+        frappe.qb.from_(address)
+        .join(link)
+        .on((link.parent == address.name) & (link.parenttype == "Address"))
+        .select(*[address[field] for field in ADDRESS_FIELDS])
+        .where((link.link_doctype == "Customer") & (link.link_name == customer))
+        .distinct()
+        .orderby(address.creation)
+        .run(as_dict=True)
+    )
+
+
+def clear_address_book(*customers):
+    """Drop the cached address books of customers, now and again once the change is committed"""
+    customers = [customer for customer in customers if customer]
+    if not customers:
+        return
+
+    frappe.cache().hdel(ADDRESS_BOOK_KEY, customers)
+    frappe.db.after_commit.add(lambda: frappe.cache().hdel(ADDRESS_BOOK_KEY, customers))
+
+
+def on_address_change(doc, method=None):
+    """doc_events handler for Address: clear the books of the customers it is (or was) linked to"""
+    links = list(doc.get("links") or [])
+    before = doc.get_doc_before_save() if method != "on_trash" else None
+    if before:
+        links += before.get("links") or []
+
+    clear_address_book(*{link.link_name for link in links if link.link_doctype == "Customer"})
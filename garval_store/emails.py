@@ -0,0 +1,133 @@
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+# Transactional email dispatch. Emails are rendered from the Jinja templates
+# in templates/emails (compiled once per worker by the Jinja environment) and
+# written to Email Queue, which records their delivery status. A job on the
+# email queue sends them right after the request commits, so requests never
+# wait on SMTP. Failed sends are retried by the Email Queue flush (up to the
+# site's email retry limit) with increasing delays (EMAIL_RETRY_DELAYS).
+
+# Dedicated RQ queue, configured under "workers" in common_site_config.json.
+# Emails fall back to the "short" queue until it is configured.
+EMAIL_QUEUE = "garval_emails"
+
+# Delay in minutes before each retry of a failed send
+EMAIL_RETRY_DELAYS = (1, 5, 30)
+
+
+def get_email_queue():
+    """Queue for email delivery jobs"""
+    workers = frappe.get_conf().get("workers") or {}
+    return EMAIL_QUEUE if EMAIL_QUEUE in workers else "short"
+
+
+def render_email(template, context=None, lang=None):
+    """Render templates/emails/<template>.html in lang (defaults to the current language)"""
+    current_lang = getattr(frappe.local, "lang", None)
+    lang = lang or current_lang or "es"
+    try:
+        frappe.local.lang = lang
+        return frappe.render_template(f"templates/emails/{template}.html", {**(context or {}), "lang": lang})
+    finally:
+        frappe.local.lang = current_lang
+
+
+def send_email(recipients, subject, template=None, context=None, lang=None, message=None,
+               attachments=None, reference_doctype=None, reference_name=None, print_attachments=None):
+    """Queue a transactional email and send it in the background.
+
+    The body is rendered from `template` with `context`, or given directly as
+    `message`. `print_attachments` lists (doctype, name, print_format) whose
+    PDFs are attached from the garval_store.pdf cache; the email is then
+    queued by a PDF job, so no Email Queue name is returned. Otherwise returns
+    the Email Queue name, which get_email_status reports on.
+    """
+    if template:
+        message = render_email(template, context, lang)
+
+    if print_attachments:
+        from garval_store.pdf import get_pdf_queue
+
+        frappe.enqueue(
+            "garval_store.emails.send_email_with_pdfs",
+            queue=get_pdf_queue(),
+            enqueue_after_commit=True,
+            recipients=recipients,
+            subject=subject,
+            message=message,
+            print_attachments=[list(attachment) for attachment in print_attachments],
+            lang=lang or getattr(frappe.local, "lang", None),
+            attachments=attachments,
+            reference_doctype=reference_doctype,
+            reference_name=reference_name
+        )
+        return None
+
+    queue = frappe.sendmail(
+        recipients=recipients,
+        subject=subject,
+        message=message,
+        attachments=attachments,
+        reference_doctype=reference_doctype,
+        reference_name=reference_name
+    )
+
+    if not queue:
+        # Nothing queued (e.g. every recipient unsubscribed)
+        return None
+
+    frappe.enqueue(
+        "garval_store.emails.deliver_email",
+        queue=get_email_queue(),
+        enqueue_after_commit=True,
+        email_queue=queue.name
+    )
+    return queue.name
+
+
+def send_email_with_pdfs(recipients, subject, message, print_attachments, lang=None, attachments=None,
+                         reference_doctype=None, reference_name=None):
+    """Background job: attach cached (or newly rendered) PDFs and queue the email"""
+    from garval_store.pdf import get_pdf
+
+    attachments = list(attachments or [])
+    for doctype, name, print_format in print_attachments:
+        attachments.append({"fname": f"{name}.pdf", "fcontent": get_pdf(doctype, name, print_format, lang)})
+
+    send_email(
+        recipients,
+        subject,
+        message=message,
+        attachments=attachments,
+        reference_doctype=reference_doctype,
+        reference_name=reference_name
+    )
+
+
+def deliver_email(email_queue):
+    """Background job: send a queued email, scheduling a retry if it fails"""
+    queue = frappe.get_doc("Email Queue", email_queue)
+    if queue.status not in ("Not Sent", "Partially Errored"):
+        # Already sent by the scheduled flush, or given up on
+        return
+
+    queue.send()
+    queue.reload()
+
+    if queue.status in ("Not Sent", "Partially Errored") and queue.retry:
+        # The send failed and Email Queue counted a retry; back off before the flush picks it up again
+        delay = EMAIL_RETRY_DELAYS[min(queue.retry, len(EMAIL_RETRY_DELAYS)) - 1]
+        queue.db_set("send_after", add_to_date(now_datetime(), minutes=delay), commit=True)
+
+
+@frappe.whitelist()
+def get_email_status(email_queue):
+    """Delivery status of a queued email"""
+    frappe.only_for("System Manager")
+    return frappe.db.get_value(
+        "Email Queue",
+        email_queue,
+        ["status", "retry", "error", "send_after", "modified"],
+        as_dict=True
+    )
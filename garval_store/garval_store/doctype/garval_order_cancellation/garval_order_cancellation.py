@@ -0,0 +1,9 @@
+# Copyright (c) 2025, Kashif Ali
+# License: MIT
+
+from frappe.model.document import Document
+
+
+class GarvalOrderCancellation(Document):
+	"""State of a customer's order cancellation job, maintained by garval_store.order_cancellation"""
+	pass
@@ -0,0 +1,9 @@
+# Copyright (c) 2025, Kashif Ali
+# License: MIT
+
+from frappe.model.document import Document
+
+
+class GarvalOrderPipeline(Document):
+	"""State of the post-order background job, maintained by garval_store.order_pipeline"""
+	pass
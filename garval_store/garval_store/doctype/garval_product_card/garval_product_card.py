@@ -0,0 +1,9 @@
+# Copyright (c) 2025, Kashif Ali
+# License: MIT
+
+from frappe.model.document import Document
+
+
+class GarvalProductCard(Document):
+	"""Denormalized catalog card, maintained by garval_store.product_cards"""
+	pass
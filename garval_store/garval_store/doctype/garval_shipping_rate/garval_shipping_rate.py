@@ -0,0 +1,46 @@
+# Copyright (c) 2025, Kashif Ali
+# License: MIT
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+from garval_store.shipping import postcode_key
+
+
+class GarvalShippingRate(Document):
+	"""Shipping price for a service, country, postcode range and weight band"""
+
+	def validate(self):
+		self.postcode_from = (self.postcode_from or "").replace(" ", "").strip().upper()
+		self.postcode_to = (self.postcode_to or "").replace(" ", "").strip().upper()
+
+		if bool(self.postcode_from) != bool(self.postcode_to):
+			frappe.throw(_("Set both Postcode From and Postcode To, or leave both empty for the whole country"))
+		if self.postcode_from and postcode_key(self.postcode_from) > postcode_key(self.postcode_to):
+			frappe.throw(_("Postcode From must not be greater than Postcode To"))
+		if self.weight_to and self.weight_from > self.weight_to:
+			frappe.throw(_("Weight From must not be greater than Weight To"))
+
+		if self.enabled and self.postcode_from:
+			self.validate_postcode_overlap()
+
+	def validate_postcode_overlap(self):
+		"""Postcode ranges of a country and service must be identical or disjoint, for the bisect lookup"""
+		start, end = postcode_key(self.postcode_from), postcode_key(self.postcode_to)
+		for other in frappe.get_all(
+			"Garval Shipping Rate",
+			filters={
+				"name": ["!=", self.name or ""],
+				"enabled": 1,
+				"country": self.country,
+				"service": self.service,
+				"postcode_from": ["is", "set"]
+			},
+			fields=["name", "postcode_from", "postcode_to"]
+		):
+			other_start, other_end = postcode_key(other.postcode_from), postcode_key(other.postcode_to)
+			if (other_start, other_end) != (start, end) and other_start <= end and start <= other_end:
+				frappe.throw(_("Postcodes {0}-{1} overlap the range {2}-{3} of {4}").format(
+					self.postcode_from, self.postcode_to, other.postcode_from, other.postcode_to, other.name
+				))
@@ -40,6 +40,15 @@ website_route_rules = [
     {"from_route": "/declaracion-accesibilidad", "to_route": "declaracion_accesibilidad"},
 ]
 
+# Language-prefixed variants (/es/shop, /en/shop, ...): the prefix sets the page language
+website_route_rules += [
+    {"from_route": f"/{lang}", "to_route": "home"} for lang in ("es", "en")
+] + [
+    {"from_route": f"/{lang}{rule['from_route']}", "to_route": rule["to_route"]}
+    for lang in ("es", "en")
+    for rule in website_route_rules
+]
+
 # Home page
 home_page = "home"
 
@@ -58,7 +67,112 @@ web_include_js = [
 ]
 
 # DocTypes
-# doc_events = {}
+# Keep the Garval Product Card read model in sync with its sources
+doc_events = {
+    "Website Item": {
+        "on_update": "garval_store.product_cards.on_source_change",
+        "on_trash": "garval_store.product_cards.on_source_trash",
+    },
+    "Item": {
+        "on_update": "garval_store.product_cards.on_source_change",
+        "on_trash": "garval_store.product_cards.on_source_trash",
+    },
+    "Item Price": {
+        "on_update": "garval_store.product_cards.on_item_price_change",
+        "on_trash": "garval_store.product_cards.on_item_price_change",
+    },
+    # Bin quantities are written without document hooks, so stock postings
+    # are followed through Stock Ledger Entry (cancellations post reversals)
+    "Stock Ledger Entry": {
+        "on_submit": "garval_store.product_cards.on_stock_change",
+    },
+    "Price List": {
+        "on_update": [
+            "garval_store.product_cards.on_pricing_settings_change",
+            "garval_store.cache.invalidate_doc_tags",
+            "garval_store.utils.clear_store_settings",
+        ],
+    },
+    "Selling Settings": {
+        "on_update": [
+            "garval_store.product_cards.on_pricing_settings_change",
+            "garval_store.cache.invalidate_doc_tags",
+            "garval_store.utils.clear_store_settings",
+        ],
+    },
+    "Global Defaults": {
+        "on_update": [
+            "garval_store.product_cards.on_pricing_settings_change",
+            "garval_store.cache.invalidate_doc_tags",
+            "garval_store.utils.clear_store_settings",
+        ],
+    },
+    "Stock Settings": {
+        "on_update": [
+            "garval_store.cache.invalidate_doc_tags",
+            "garval_store.utils.clear_store_settings",
+        ],
+    },
+    # Invalidate cached lookups (see garval_store.cache.CACHE_TAGS_BY_DOCTYPE)
+    "Item Group": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Payment Gateway Account": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Payment Gateway": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Company": {
+        "on_update": [
+            "garval_store.cache.invalidate_doc_tags",
+            "garval_store.utils.clear_store_settings",
+        ],
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Currency": {
+        "on_update": [
+            "garval_store.cache.invalidate_doc_tags",
+            "garval_store.utils.clear_store_settings",
+        ],
+    },
+    "Sales Taxes and Charges Template": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Social Login Key": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Garval Shipping Rate": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    "Shipping Rule": {
+        "on_update": "garval_store.cache.invalidate_doc_tags",
+        "on_trash": "garval_store.cache.invalidate_doc_tags",
+    },
+    # Clear cached shopper identities (see garval_store.commerce_context)
+    "User": {
+        "on_update": "garval_store.commerce_context.on_user_change",
+        "on_trash": "garval_store.commerce_context.on_user_change",
+    },
+    "Customer": {
+        "on_update": "garval_store.commerce_context.on_customer_change",
+        "on_trash": "garval_store.commerce_context.on_customer_change",
+    },
+    "Contact": {
+        "on_update": "garval_store.commerce_context.on_contact_change",
+        "on_trash": "garval_store.commerce_context.on_contact_change",
+    },
+    "Address": {
+        "on_update": "garval_store.commerce_context.on_address_change",
+        "on_trash": "garval_store.commerce_context.on_address_change",
+    },
+}
 
 # On login hook - create Customer if not exists (for SSO users)
 on_login = "garval_store.user_hooks.on_user_login"
@@ -67,10 +181,19 @@ on_login = "garval_store.user_hooks.on_user_login"
 on_session_creation = "garval_store.user_hooks.on_session_creation"
 
 # Scheduled Tasks
-# scheduler_events = {}
+scheduler_events = {
+    "cron": {
+        # Re-queue order pipelines and cancellations whose retry is due or whose job was lost
+        "* * * * *": [
+            "garval_store.order_pipeline.retry_stuck_pipelines",
+            "garval_store.order_cancellation.retry_stuck_cancellations"
+        ]
+    }
+}
 
 # Installation hooks
 after_install = "garval_store.install.after_install"
+after_migrate = "garval_store.install.after_migrate"
 
 # Website context
 website_context = {
@@ -78,6 +201,12 @@ website_context = {
     "splash_image": "/assets/garval_store/images/logo.png"
 }
 
+# Serve guest catalog pages (home, shop, product) from the rendered-HTML cache
+page_renderer = [
+    "garval_store.static_pages.StaticPageRenderer",
+    "garval_store.page_cache.CatalogPageRenderer"
+]
+
 # Update website context to conditionally exclude CSS from Frappe login/signup pages
 update_website_context = "garval_store.utils.update_website_context"
 
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from contextlib import contextmanager
+
+import frappe
+from frappe import _
+
+# Results of write endpoints are stored per (scope, user, Idempotency-Key), so
+# client retries and double clicks get the original result instead of
+# repeating the work.
+
+IDEMPOTENCY_KEY = "garval_idempotency:{0}:{1}"
+IDEMPOTENCY_TTL = 24 * 60 * 60
+ORDER_LOCK_KEY = "garval_order_lock:{0}"
+
+
+def get_idempotency_key(key=None):
+    """Idempotency key from the `idempotency_key` param or the Idempotency-Key header"""
+    if not key:
+        request = getattr(frappe.local, "request", None)
+        key = request.headers.get("Idempotency-Key") if request else None
+    key = (key or "").strip()
+    return key[:255] or None
+
+
+def run_idempotent(scope, key, func, *args, fingerprint=None, ttl=IDEMPOTENCY_TTL, **kwargs):
+    """Run func once per scope, user and idempotency key.
+
+    Repeated calls with the same key get the stored result of the first
+    successful call; concurrent calls wait for it. Failed results are not
+    stored, so the client can retry them. While func runs, the stored key is
+    in frappe.flags.idempotency_key (see forget_idempotent_result). `fingerprint` identifies the request
+    payload: reusing a key for a different payload is rejected.
+    """
+    if not key:
+        return func(*args, **kwargs)
+
+    cache = frappe.cache()
+    digest = hashlib.md5(f"{frappe.session.user}:{key}".encode()).hexdigest()
+    cache_key = IDEMPOTENCY_KEY.format(scope, digest)
+    payload = hashlib.md5(json.dumps(fingerprint, sort_keys=True, default=str).encode()).hexdigest()
+
+    with redis_lock(f"{cache_key}:lock", timeout=120, wait=60):
+        stored = cache.get_value(cache_key)
+        if stored:
+            if stored["fingerprint"] != payload:
+                return {"success": False, "error": _("This request was already submitted with different data")}
+            return stored["result"]
+
+        # Lets func record the key, so work it hands off can forget the result if it fails later
+        previous_key = frappe.flags.idempotency_key
+        frappe.flags.idempotency_key = cache_key
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            frappe.flags.idempotency_key = previous_key
+
+        if isinstance(result, dict) and result.get("success"):
+            cache.set_value(cache_key, {"fingerprint": payload, "result": result}, expires_in_sec=ttl)
+        return result
+
+
+def forget_idempotent_result(cache_key):
+    """Drop a stored result, so a retry with the same idempotency key runs again"""
+    if cache_key:
+        frappe.cache().delete_value(cache_key)
+
+
+class LockNotAcquired(frappe.ValidationError):
+    """Another worker held the lock for longer than the wait"""
+
+
+@contextmanager
+def order_lock(sales_order, timeout=120, wait=60):
+    """Serialize invoice and payment request creation for a Sales Order across workers"""
+    with redis_lock(ORDER_LOCK_KEY.format(sales_order), timeout=timeout, wait=wait):
+        yield
+
+
+@contextmanager
+def redis_lock(name, timeout=120, wait=60):
+    """Site-wide Redis lock; waits up to `wait` seconds for the current holder"""
+    from redis.exceptions import LockError
+
+    cache = frappe.cache()
+    lock = cache.lock(cache.make_key(name), timeout=timeout, blocking_timeout=wait)
+    if not lock.acquire():
+        frappe.throw(_("This order is being processed. Please try again in a moment."), LockNotAcquired)
+
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # Lock expired while held; another worker may own it now
+            pass
@@ -9,6 +9,14 @@ def after_install():
     pass
 
 
+def after_migrate():
+    """Queue a product card rebuild and pre-render the static pages for the new release"""
+    from garval_store.product_cards import enqueue_rebuild_product_cards
+    from garval_store.static_pages import prerender_static_pages_after_migrate
+    enqueue_rebuild_product_cards()
+    prerender_static_pages_after_migrate()
+
+
 def create_email_verification_fields():
     """Create custom fields on User doctype for email verification"""
 
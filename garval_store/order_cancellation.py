@@ -0,0 +1,215 @@
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, now_datetime
+
+# Customer order cancellations run in a background job. The job cancels the
+# order's Payment Requests, then its Sales Invoices, then the Sales Order, and
+# commits once for the whole chain, so a failure leaves nothing half cancelled.
+# Progress is persisted in a Garval Order Cancellation document per Sales Order:
+#
+#   Queued -> Cancelled
+#          \-> Failed
+#
+# A job that can't get the order lock schedules a retry with a backoff, and
+# retry_stuck_cancellations (run by the scheduler) re-queues cancellations
+# whose retry is due or whose job was lost, failing them after
+# CANCELLATION_MAX_ATTEMPTS so the customer can ask again.
+
+CANCELLATION_DOCTYPE = "Garval Order Cancellation"
+
+# Seconds the job waits for the order lock before scheduling a retry
+CANCELLATION_LOCK_WAIT = 60
+
+# Delay in minutes before retrying a job that couldn't get the order lock
+CANCELLATION_RETRY_DELAYS = (1, 5, 15)
+
+# A cancellation still queued this many minutes after its last attempt lost its job
+CANCELLATION_STALE_MINUTES = 10
+
+CANCELLATION_MAX_ATTEMPTS = 5
+
+
+def request_cancellation(sales_order):
+    """Record a cancellation request for a Sales Order and queue its job once committed"""
+    if frappe.db.exists(CANCELLATION_DOCTYPE, sales_order):
+        cancellation = frappe.get_doc(CANCELLATION_DOCTYPE, sales_order)
+        if cancellation.status != "Queued":
+            # Retry after a failure
+            cancellation.db_set({
+                "status": "Queued",
+                "error": None,
+                "requested_by": frappe.session.user,
+                "attempts": 0,
+                "retry_after": None
+            })
+    else:
+        frappe.get_doc({
+            "doctype": CANCELLATION_DOCTYPE,
+            "sales_order": sales_order,
+            "status": "Queued",
+            "requested_by": frappe.session.user
+        }).insert(ignore_permissions=True)
+
+    enqueue_cancellation(sales_order)
+
+
+def enqueue_cancellation(sales_order):
+    """Queue (or re-queue) the cancellation job for a Sales Order"""
+    from garval_store.order_pipeline import get_pipeline_queue
+
+    frappe.enqueue(
+        "garval_store.order_cancellation.run_cancellation",
+        queue=get_pipeline_queue(),
+        job_id=f"garval_store::order_cancellation::{sales_order}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        sales_order=sales_order
+    )
+
+
+def get_cancellation_status(sales_order):
+    """Current state of a Sales Order's cancellation, or None if none was requested"""
+    return frappe.db.get_value(
+        CANCELLATION_DOCTYPE,
+        sales_order,
+        ["status", "error"],
+        as_dict=True
+    )
+
+
+def get_pending_cancellations(sales_orders):
+    """Names of the given Sales Orders whose cancellation is still queued"""
+    if not sales_orders:
+        return set()
+
+    return set(frappe.get_all(
+        CANCELLATION_DOCTYPE,
+        filters={"sales_order": ["in", list(sales_orders)], "status": "Queued"},
+        pluck="sales_order"
+    ))
+
+
+def get_cancellation_chain(sales_order):
+    """(doctype, name) of the submitted documents to cancel, in cancellation order"""
+    invoices = list(dict.fromkeys(frappe.get_all(
+        "Sales Invoice Item",
+        filters={"sales_order": sales_order, "docstatus": 1},
+        pluck="parent"
+    )))
+
+    payment_requests = frappe.get_all(
+        "Payment Request",
+        filters={"reference_doctype": "Sales Order", "reference_name": sales_order, "docstatus": 1},
+        pluck="name"
+    )
+    if invoices:
+        payment_requests += frappe.get_all(
+            "Payment Request",
+            filters={"reference_doctype": "Sales Invoice", "reference_name": ["in", invoices], "docstatus": 1},
+            pluck="name"
+        )
+
+    return (
+        [("Payment Request", name) for name in payment_requests]
+        + [("Sales Invoice", name) for name in invoices]
+        + [("Sales Order", sales_order)]
+    )
+
+
+def run_cancellation(sales_order):
+    """Background job: cancel a Sales Order with its Payment Requests and Sales Invoices"""
+    from garval_store.idempotency import LockNotAcquired
+
+    try:
+        _run_cancellation(sales_order)
+    except LockNotAcquired:
+        schedule_retry(sales_order)
+
+
+def _run_cancellation(sales_order):
+    from garval_store.idempotency import order_lock
+
+    # Same lock as the order pipeline, so an order is never invoiced while it is cancelled
+    with order_lock(sales_order, timeout=300, wait=CANCELLATION_LOCK_WAIT):
+        cancellation = frappe.get_doc(CANCELLATION_DOCTYPE, sales_order)
+        if cancellation.status != "Queued":
+            return
+
+        cancellation.db_set({"attempts": (cancellation.attempts or 0) + 1, "retry_after": None}, commit=True)
+
+        try:
+            cancelled = []
+            for doctype, name in get_cancellation_chain(sales_order):
+                doc = frappe.get_doc(doctype, name)
+                if doc.docstatus == 1:
+                    doc.flags.ignore_permissions = True
+                    doc.cancel()
+                    cancelled.append(f"{doctype} {name}")
+
+            cancellation.update({"status": "Cancelled", "cancelled_documents": "\n".join(cancelled)})
+            cancellation.db_update()
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(
+                f"Error cancelling order: {str(e)}\nOrder: {sales_order}\nTraceback: {frappe.get_traceback()}",
+                "Cancel Order Error"
+            )
+            cancellation.db_set({
+                "status": "Failed",
+                "error": _("Order cancellation failed. Please contact support.")
+            }, commit=True)
+
+
+def schedule_retry(sales_order):
+    """Let retry_stuck_cancellations re-queue the job after a backoff, counting the attempt"""
+    cancellation = frappe.db.get_value(CANCELLATION_DOCTYPE, sales_order, ["status", "attempts"], as_dict=True)
+    if not cancellation or cancellation.status != "Queued":
+        return
+
+    attempts = (cancellation.attempts or 0) + 1
+    if attempts >= CANCELLATION_MAX_ATTEMPTS:
+        fail_cancellation(sales_order, attempts)
+        return
+
+    delay = CANCELLATION_RETRY_DELAYS[min(attempts, len(CANCELLATION_RETRY_DELAYS)) - 1]
+    frappe.db.set_value(CANCELLATION_DOCTYPE, sales_order, {
+        "attempts": attempts,
+        "retry_after": add_to_date(now_datetime(), minutes=delay)
+    })
+    frappe.db.commit()
+
+
+def retry_stuck_cancellations():
+    """Scheduled job: re-queue cancellations that are due a retry or lost their job, or fail them"""
+    now = now_datetime()
+    stale = add_to_date(now, minutes=-CANCELLATION_STALE_MINUTES)
+
+    for cancellation in frappe.get_all(
+        CANCELLATION_DOCTYPE,
+        filters={"status": "Queued"},
+        fields=["sales_order", "attempts", "retry_after", "modified"]
+    ):
+        due = cancellation.retry_after <= now if cancellation.retry_after else cancellation.modified <= stale
+        if not due:
+            continue
+
+        if (cancellation.attempts or 0) >= CANCELLATION_MAX_ATTEMPTS:
+            fail_cancellation(cancellation.sales_order, cancellation.attempts)
+        else:
+            enqueue_cancellation(cancellation.sales_order)
+
+
+def fail_cancellation(sales_order, attempts):
+    """Give up on a cancellation that never got to run; the customer can request it again"""
+    frappe.log_error(
+        f"Order cancellation gave up after {attempts} attempts\nOrder: {sales_order}",
+        "Cancel Order Error"
+    )
+    frappe.db.set_value(CANCELLATION_DOCTYPE, sales_order, {
+        "status": "Failed",
+        "attempts": attempts,
+        "retry_after": None,
+        "error": _("Your order could not be cancelled right now. Please try again in a few minutes.")
+    })
+    frappe.db.commit()
@@ -1,5 +1,6 @@
 import frappe
 from frappe import _
+from garval_store.emails import send_email
 from garval_store.utils import format_currency
 
 
@@ -44,7 +45,7 @@ def send_order_confirmation(payment_request_name):
     # Send the email
     _send_confirmation_email(sales_order, customer_email)
 
-    frappe.msgprint(_("Order confirmation email sent to {0}").format(customer_email))
+    frappe.msgprint(_("Order confirmation email queued for {0}").format(customer_email))
 
     return {"success": True, "email": customer_email}
 
@@ -53,46 +54,18 @@ def _send_confirmation_email(order, email):
     """Send order confirmation email with order details"""
     subject = _("Payment Confirmed - Order {0}").format(order.name)
 
-    message = f"""
-    <h2>{_('Payment Received - Thank You!')}</h2>
-    <p>{_('We have received your payment for order')} <strong>{order.name}</strong>.</p>
-    <p>{_('Your order is now being processed.')}</p>
-
-    <h3>{_('Order Details')}</h3>
-    <table style="width: 100%; border-collapse: collapse;">
-        <tr style="background: #f5f5f5;">
-            <th style="padding: 10px; text-align: left;">{_('Product')}</th>
-            <th style="padding: 10px; text-align: right;">{_('Qty')}</th>
-            <th style="padding: 10px; text-align: right;">{_('Price')}</th>
-        </tr>
-    """
-
-    for item in order.items:
-        message += f"""
-        <tr>
-            <td style="padding: 10px; border-bottom: 1px solid #ddd;">{item.item_name}</td>
-            <td style="padding: 10px; border-bottom: 1px solid #ddd; text-align: right;">{int(item.qty)}</td>
-            <td style="padding: 10px; border-bottom: 1px solid #ddd; text-align: right;">{format_currency(item.amount)}</td>
-        </tr>
-        """
-
-    message += f"""
-    </table>
-
-    <p style="margin-top: 20px; font-size: 18px;">
-        <strong>{_('Total')}: {format_currency(order.grand_total)}</strong>
-    </p>
-
-    <p>{_('We will notify you when your order ships.')}</p>
-
-    <p>{_('Best regards,')}<br>Finca Garval</p>
-    """
-
-    frappe.sendmail(
+    send_email(
         recipients=[email],
         subject=subject,
-        message=message,
+        template="payment_confirmed",
+        context={
+            "order_id": order.name,
+            "items": [
+                {"item_name": item.item_name, "qty": int(item.qty), "amount": format_currency(item.amount)}
+                for item in order.items
+            ],
+            "total": format_currency(order.grand_total)
+        },
         reference_doctype="Sales Order",
-        reference_name=order.name,
-        now=True
+        reference_name=order.name
     )
@@ -0,0 +1,139 @@
+import frappe
+from frappe.utils import get_datetime
+
+# Order history for My Account. Orders are paged by keyset on
+# (creation, name), newest first, so every page costs the same however many
+# orders the customer has. A page is built with a fixed number of queries:
+# the orders, their items, their invoices, and the pending checkout pipelines
+# and cancellations.
+
+ORDER_HISTORY_PAGE_SIZE = 20
+ORDER_HISTORY_MAX_PAGE_SIZE = 50
+ORDER_PREVIEW_ITEMS = 3
+
+
+def get_order_history(customer, cursor=None, limit=ORDER_HISTORY_PAGE_SIZE):
+    """One page of a customer's orders with their summaries.
+
+    Returns {"orders": [...], "next_cursor": ...}; pass next_cursor back to
+    get the following page. It is None on the last page.
+    """
+    if not customer:
+        return {"orders": [], "next_cursor": None}
+
+    limit = max(1, min(int(limit or ORDER_HISTORY_PAGE_SIZE), ORDER_HISTORY_MAX_PAGE_SIZE))
+
+    so = frappe.qb.DocType("Sales Order")
+    query = (
+        frappe.qb.from_(so)
+        .select(
+            so.name, so.creation, so.transaction_date, so.grand_total,
+            so.status, so.delivery_status, so.billing_status, so.advance_payment_status
+        )
+        .where((so.customer == customer) & (so.docstatus != 2) & (so.status != "Cancelled"))
+        .orderby(so.creation, order=frappe.qb.desc)
+        .orderby(so.name, order=frappe.qb.desc)
+        # One extra row tells whether there is a next page
+        .limit(limit + 1)
+    )
+
+    after = parse_cursor(cursor)
+    if after:
+        creation, name = after
+        query = query.where((so.creation < creation) | ((so.creation == creation) & (so.name < name)))
+
+    orders = query.run(as_dict=True)
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+
+    add_order_summaries(orders)
+
+    next_cursor = None
+    if has_more:
+        last = orders[-1]
+        next_cursor = f"{last.creation.isoformat()}|{last.name}"
+
+    return {"orders": orders, "next_cursor": next_cursor}
+
+
+def parse_cursor(cursor):
+    """(creation, name) from a cursor, or None for the first page"""
+    if not cursor or "|" not in cursor:
+        return None
+    creation, name = cursor.split("|", 1)
+    try:
+        return get_datetime(creation), name
+    except Exception:
+        return None
+
+
+def add_order_summaries(orders):
+    """Add item count, first items and payment state to orders"""
+    if not orders:
+        return
+
+    names = [order.name for order in orders]
+
+    items = {}
+    for row in frappe.get_all(
+        "Sales Order Item",
+        filters={"parent": ["in", names], "parenttype": "Sales Order"},
+        fields=["parent", "item_code", "item_name", "qty", "image"],
+        order_by="parent asc, idx asc"
+    ):
+        items.setdefault(row.parent, []).append(row)
+
+    from garval_store.order_cancellation import get_pending_cancellations
+    from garval_store.order_pipeline import PIPELINE_DOCTYPE, PIPELINE_DONE
+
+    # Invoiced and outstanding amounts per order
+    invoices = {}
+    si = frappe.qb.DocType("Sales Invoice")
+    sii = frappe.qb.DocType("Sales Invoice Item")
+    for row in (
+        frappe.qb.from_(sii)
+        .join(si)
+        .on(si.name == sii.parent)
+        .select(sii.sales_order, si.name, si.grand_total, si.outstanding_amount)
+        .where(sii.sales_order.isin(names) & (si.docstatus == 1))
+        .distinct()
+        .run(as_dict=True)
+    ):
+        totals = invoices.setdefault(row.sales_order, {"invoiced": 0, "outstanding": 0})
+        totals["invoiced"] += row.grand_total or 0
+        totals["outstanding"] += row.outstanding_amount or 0
+
+    pending_cancellations = get_pending_cancellations(names)
+    pending_payments = set(frappe.get_all(
+        PIPELINE_DOCTYPE,
+        filters={"sales_order": ["in", names], "status": ["not in", PIPELINE_DONE]},
+        pluck="sales_order"
+    ))
+
+    for order in orders:
+        order_items = items.get(order.name, [])
+        order.item_count = len(order_items)
+        order.items = [
+            {"item_code": item.item_code, "item_name": item.item_name, "qty": item.qty, "image": item.image}
+            for item in order_items[:ORDER_PREVIEW_ITEMS]
+        ]
+        order.more_items = max(0, len(order_items) - ORDER_PREVIEW_ITEMS)
+        order.cancellation_pending = order.name in pending_cancellations
+        order.payment_state = get_payment_state(order, invoices.get(order.name), order.name in pending_payments)
+
+
+def get_payment_state(order, invoices=None, payment_pending=False):
+    """Payment state shown to the customer: Preparing, Unpaid, Partly Paid or Paid"""
+    if payment_pending:
+        return "Preparing"
+    if order.advance_payment_status == "Fully Paid":
+        return "Paid"
+    if invoices and invoices["invoiced"]:
+        if invoices["outstanding"] <= 0:
+            return "Paid"
+        if invoices["outstanding"] < invoices["invoiced"]:
+            return "Partly Paid"
+        return "Unpaid"
+    if order.advance_payment_status == "Partially Paid":
+        return "Partly Paid"
+    return "Unpaid"
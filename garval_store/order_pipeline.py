@@ -0,0 +1,318 @@
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, now_datetime
+
+# Sales Invoice and Payment Request creation for webshop orders runs in a
+# background job after the Sales Order is submitted. Progress is persisted in
+# a Garval Order Pipeline document, one per Sales Order:
+#
+#   Queued -> Invoice Created -> Payment Request Created -> Completed
+#                                                       \-> Failed
+#
+# Each stage commits, so a retried job resumes from the last completed stage.
+# A job that can't get the order lock schedules a retry with a backoff, and
+# retry_stuck_pipelines (run by the scheduler) re-queues pipelines whose job
+# was lost (worker restart, timeout) until PIPELINE_MAX_ATTEMPTS is reached.
+# When a stage fails the job cancels what it created and the Sales Order, and
+# forgets the stored checkout result so the customer can place the order again.
+
+PIPELINE_DOCTYPE = "Garval Order Pipeline"
+
+# Dedicated RQ queue, configured under "workers" in common_site_config.json.
+# Orders fall back to the "short" queue until it is configured.
+PIPELINE_QUEUE = "garval_orders"
+
+PIPELINE_DONE = ("Completed", "Failed")
+
+# Delay in minutes before retrying a job that couldn't get the order lock
+PIPELINE_RETRY_DELAYS = (1, 5, 15)
+
+# A pipeline not done this many minutes after its last attempt lost its job
+PIPELINE_STALE_MINUTES = 10
+
+PIPELINE_MAX_ATTEMPTS = 5
+
+
+def get_pipeline_queue():
+    """Queue for order pipeline jobs"""
+    workers = frappe.get_conf().get("workers") or {}
+    return PIPELINE_QUEUE if PIPELINE_QUEUE in workers else "short"
+
+
+def start_order_pipeline(sales_order, payment_gateway_account, email_to=None):
+    """Record the pipeline for a submitted Sales Order and queue its job once the order is committed"""
+    frappe.get_doc({
+        "doctype": PIPELINE_DOCTYPE,
+        "sales_order": sales_order,
+        "status": "Queued",
+        "payment_gateway_account": payment_gateway_account,
+        "email_to": email_to,
+        # Set when the order comes from an idempotent request; forgotten if the pipeline fails
+        "idempotency_key": frappe.flags.idempotency_key
+    }).insert(ignore_permissions=True)
+
+    enqueue_order_pipeline(sales_order)
+
+
+def enqueue_order_pipeline(sales_order):
+    """Queue (or re-queue) the background job for a Sales Order"""
+    frappe.enqueue(
+        "garval_store.order_pipeline.run_order_pipeline",
+        queue=get_pipeline_queue(),
+        job_id=f"garval_store::order_pipeline::{sales_order}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        sales_order=sales_order
+    )
+
+
+def get_pipeline_status(sales_order):
+    """Current state of a Sales Order's pipeline, or None if it has none"""
+    return frappe.db.get_value(
+        PIPELINE_DOCTYPE,
+        sales_order,
+        ["status", "payment_url", "error"],
+        as_dict=True
+    )
+
+
+def run_order_pipeline(sales_order):
+    """Background job: run the remaining stages of a Sales Order's pipeline"""
+    from garval_store.idempotency import LockNotAcquired
+
+    try:
+        _run_order_pipeline(sales_order)
+    except LockNotAcquired:
+        schedule_retry(sales_order)
+
+
+def _run_order_pipeline(sales_order):
+    from garval_store.idempotency import order_lock
+
+    # Same lock as api.orders.get_payment_url, so they never both create documents
+    with order_lock(sales_order, timeout=300):
+        pipeline = frappe.get_doc(PIPELINE_DOCTYPE, sales_order)
+        if pipeline.status in PIPELINE_DONE:
+            return
+
+        pipeline.db_set({"attempts": (pipeline.attempts or 0) + 1, "retry_after": None}, commit=True)
+
+        try:
+            if pipeline.status == "Queued":
+                create_invoice(pipeline)
+            if pipeline.status == "Invoice Created":
+                create_payment_request(pipeline)
+            if pipeline.status == "Payment Request Created":
+                create_payment_url(pipeline)
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(
+                f"Error creating payment request: {str(e)}\nTraceback: {frappe.get_traceback()}\nSales Order: {sales_order}",
+                "Payment Error"
+            )
+            compensate(pipeline, e)
+
+
+def schedule_retry(sales_order):
+    """Let retry_stuck_pipelines re-queue the job after a backoff, counting the attempt"""
+    pipeline = frappe.db.get_value(PIPELINE_DOCTYPE, sales_order, ["status", "attempts"], as_dict=True)
+    if not pipeline or pipeline.status in PIPELINE_DONE:
+        return
+
+    attempts = (pipeline.attempts or 0) + 1
+    delay = PIPELINE_RETRY_DELAYS[min(attempts, len(PIPELINE_RETRY_DELAYS)) - 1]
+    frappe.db.set_value(PIPELINE_DOCTYPE, sales_order, {
+        "attempts": attempts,
+        "retry_after": add_to_date(now_datetime(), minutes=delay)
+    })
+    frappe.db.commit()
+
+
+def retry_stuck_pipelines():
+    """Scheduled job: re-queue pipelines that are due a retry or lost their job, or fail them"""
+    now = now_datetime()
+    stale = add_to_date(now, minutes=-PIPELINE_STALE_MINUTES)
+
+    for pipeline in frappe.get_all(
+        PIPELINE_DOCTYPE,
+        filters={"status": ["not in", PIPELINE_DONE]},
+        fields=["sales_order", "attempts", "retry_after", "modified"]
+    ):
+        due = pipeline.retry_after <= now if pipeline.retry_after else pipeline.modified <= stale
+        if not due:
+            continue
+
+        if (pipeline.attempts or 0) >= PIPELINE_MAX_ATTEMPTS:
+            fail_pipeline(pipeline.sales_order)
+        else:
+            enqueue_order_pipeline(pipeline.sales_order)
+
+
+def fail_pipeline(sales_order):
+    """Give up on a pipeline after PIPELINE_MAX_ATTEMPTS and compensate"""
+    from garval_store.idempotency import LockNotAcquired, order_lock
+
+    try:
+        with order_lock(sales_order, timeout=300, wait=0):
+            pipeline = frappe.get_doc(PIPELINE_DOCTYPE, sales_order)
+            if pipeline.status in PIPELINE_DONE:
+                return
+
+            frappe.log_error(
+                f"Order pipeline gave up after {pipeline.attempts} attempts\nSales Order: {sales_order}",
+                "Payment Error"
+            )
+            compensate(pipeline, _("Order processing did not complete"))
+    except LockNotAcquired:
+        # A job is running it right now; check again on the next sweep
+        pass
+
+
+def create_invoice(pipeline):
+    """Stage 1: create and submit the Sales Invoice for the order"""
+    from erpnext.selling.doctype.sales_order.sales_order import make_sales_invoice
+
+    # make_sales_invoice already runs set_missing_values and calculate_taxes_and_totals
+    si_doc = make_sales_invoice(pipeline.sales_order, ignore_permissions=True)
+    si_doc.insert(ignore_permissions=True)
+    si_doc.flags.ignore_permissions = True
+    si_doc.submit()
+
+    set_stage(pipeline, "Invoice Created", sales_invoice=si_doc.name)
+
+    # Render the invoice PDF ahead of the customer downloading it
+    from garval_store.pdf import enqueue_pdf
+    enqueue_pdf("Sales Invoice", si_doc.name)
+
+
+def create_payment_request(pipeline):
+    """Stage 2: create and submit the Payment Request for the invoice"""
+    si_doc = frappe.get_doc("Sales Invoice", pipeline.sales_invoice)
+    payment_gateway_account = frappe.get_doc("Payment Gateway Account", pipeline.payment_gateway_account)
+
+    # Check if Payment Gateway has a controller (Bank Transfer doesn't)
+    pg_controller = frappe.db.get_value("Payment Gateway", payment_gateway_account.payment_gateway, "gateway_controller")
+    is_bank_transfer = not pg_controller or "Bank Transfer" in str(payment_gateway_account.payment_gateway)
+
+    # Get message and subject from Payment Gateway Account (like UI does)
+    pr_message = payment_gateway_account.message or _("Payment request for invoice {0}").format(si_doc.name)
+
+    values = {
+        "doctype": "Payment Request",
+        "payment_gateway_account": payment_gateway_account.name,
+        "payment_gateway": payment_gateway_account.payment_gateway,
+        "payment_account": payment_gateway_account.payment_account,
+        # Use outstanding_amount instead of grand_total for Payment Request
+        "grand_total": si_doc.outstanding_amount,
+        "email_to": pipeline.email_to,
+        "message": pr_message,
+        "reference_doctype": "Sales Invoice",
+        "reference_name": si_doc.name,
+        "party_type": "Customer",
+        "party": si_doc.customer
+    }
+
+    if is_bank_transfer:
+        # Get first enabled bank account for company (don't check is_company_account)
+        bank_account = frappe.db.get_value(
+            "Bank Account",
+            {"company": si_doc.company, "disabled": 0},
+            "name",
+            order_by="is_default desc, creation desc"
+        )
+
+        if not bank_account:
+            frappe.throw(_("No company bank account found for Bank Transfer. Please configure one."))
+
+        values.update({
+            "currency": si_doc.currency,
+            "mode_of_payment": payment_gateway_account.payment_gateway,
+            "subject": getattr(payment_gateway_account, "subject", None) or _("Invoice pending for {0}").format(pipeline.sales_order),
+            "bank_account": bank_account
+        })
+    else:
+        # Get or create Mode of Payment
+        mode_of_payment = payment_gateway_account.payment_gateway
+        if not frappe.db.exists("Mode of Payment", mode_of_payment):
+            frappe.get_doc({
+                "doctype": "Mode of Payment",
+                "mode_of_payment": mode_of_payment,
+                "type": "General"
+            }).insert(ignore_permissions=True)
+
+        values.update({
+            "currency": payment_gateway_account.currency or si_doc.currency,
+            "mode_of_payment": mode_of_payment,
+            "subject": getattr(payment_gateway_account, "subject", None) or _("Payment Request for {0}").format(si_doc.name),
+            "mute_email": 1  # Don't send email, we're redirecting directly
+        })
+
+    pr = frappe.get_doc(values)
+    pr.insert(ignore_permissions=True)
+    pr.submit()
+
+    if is_bank_transfer:
+        # No payment URL for Bank Transfer; the Payment Request email has the bank details
+        set_stage(pipeline, "Completed", payment_request=pr.name)
+    else:
+        set_stage(pipeline, "Payment Request Created", payment_request=pr.name)
+
+
+def create_payment_url(pipeline):
+    """Stage 3: generate the gateway payment URL"""
+    pr = frappe.get_doc("Payment Request", pipeline.payment_request)
+
+    payment_url = None
+    try:
+        payment_url = pr.payment_url
+        if not payment_url:
+            pr.set_payment_request_url()
+            payment_url = pr.payment_url
+    except Exception as url_error:
+        # The order is still payable from My Account, so don't fail the pipeline
+        frappe.log_error(f"Payment URL generation failed: {str(url_error)}", "Payment URL Error")
+
+    set_stage(pipeline, "Completed", payment_url=payment_url)
+
+
+def set_stage(pipeline, status, **values):
+    """Persist a completed stage"""
+    pipeline.update({"status": status, **values})
+    pipeline.db_update()
+    frappe.db.commit()
+
+
+def compensate(pipeline, error):
+    """Cancel what the pipeline created and the Sales Order, then mark it failed"""
+    pipeline.reload()
+
+    for doctype, name in (
+        ("Payment Request", pipeline.payment_request),
+        ("Sales Invoice", pipeline.sales_invoice),
+        ("Sales Order", pipeline.sales_order)
+    ):
+        if not name:
+            continue
+        try:
+            doc = frappe.get_doc(doctype, name)
+            if doc.docstatus == 1:  # If submitted
+                doc.flags.ignore_permissions = True
+                doc.cancel()
+                frappe.db.commit()
+                frappe.log_error(f"Cancelled {doctype} {name} due to payment error", "Payment Error")
+        except Exception as cancel_error:
+            frappe.db.rollback()
+            frappe.log_error(f"Error cancelling {doctype}: {str(cancel_error)}", "Payment Error")
+
+    # Store the message shown to the customer
+    error_detail = str(error)
+    if "Settings not found" in error_detail:
+        message = _("Payment gateway configuration error. Please contact support.")
+    else:
+        message = _("Failed to process payment: {0}").format(error_detail)
+
+    set_stage(pipeline, "Failed", error=message)
+
+    # The order is cancelled, so a retry of the checkout must place a new one
+    from garval_store.idempotency import forget_idempotent_result
+    forget_idempotent_result(pipeline.idempotency_key)
@@ -0,0 +1,81 @@
+import hashlib
+import hmac
+import time
+
+import frappe
+
+# Signed view tokens for the order confirmation page. create_order issues
+# "<expiry>.<signature>", an HMAC-SHA256 of the order id and expiry under the
+# site's encryption key, so the page can check access without a database
+# query and guests can see the order they just placed.
+
+ORDER_VIEW_TTL = 24 * 60 * 60
+
+
+def _sign(order_id, expiry):
+    from frappe.utils.password import get_encryption_key
+
+    message = f"order_view:{order_id}:{expiry}".encode()
+    return hmac.new(get_encryption_key().encode(), message, hashlib.sha256).hexdigest()
+
+
+def make_order_view_token(order_id, ttl=ORDER_VIEW_TTL):
+    """Token that lets its holder view an order until it expires"""
+    expiry = int(time.time()) + ttl
+    return f"{expiry}.{_sign(order_id, expiry)}"
+
+
+def verify_order_view_token(order_id, token):
+    """Whether token is a valid, unexpired view token for order_id"""
+    if not order_id or not token or "." not in token:
+        return False
+
+    expiry, signature = token.split(".", 1)
+    if not expiry.isdigit() or int(expiry) < time.time():
+        return False
+
+    return hmac.compare_digest(signature, _sign(order_id, int(expiry)))
+
+
+def get_order_view(order_id):
+    """What the confirmation page shows of an order: items, taxes and totals, in two queries"""
+    so = frappe.qb.DocType("Sales Order")
+    soi = frappe.qb.DocType("Sales Order Item")
+    rows = (
+        frappe.qb.from_(so)
+        .left_join(soi)
+        .on((soi.parent == so.name) & (soi.parenttype == "Sales Order"))
+        .select(
+            so.name, so.customer, so.net_total, so.grand_total, so.total_taxes_and_charges,
+            soi.item_name, soi.qty, soi.amount
+        )
+        .where(so.name == order_id)
+        .orderby(soi.idx)
+        .run(as_dict=True)
+    )
+    if not rows:
+        return None
+
+    header = rows[0]
+    items = [
+        frappe._dict({"item_name": row.item_name, "qty": row.qty, "amount": row.amount})
+        for row in rows if row.item_name is not None
+    ]
+
+    taxes = frappe.get_all(
+        "Sales Taxes and Charges",
+        filters={"parent": order_id, "parenttype": "Sales Order"},
+        fields=["description", "tax_amount", "rate"],
+        order_by="idx"
+    )
+
+    return frappe._dict({
+        "name": header.name,
+        "customer": header.customer,
+        # Calculate net_total from items if not available
+        "net_total": header.net_total or sum(item.amount or 0 for item in items),
+        "grand_total": header.grand_total,
+        "total_taxes_and_charges": header.total_taxes_and_charges,
+        "items": items,
+        "taxes": taxes
+    })
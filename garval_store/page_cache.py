@@ -0,0 +1,116 @@
+import hashlib
+
+import frappe
+from frappe.website.page_renderers.template_page import TemplatePage
+
+from garval_store.cache import get_tag_versions
+from garval_store.utils import get_lang, get_path_lang, get_store_settings
+
+# Catalog pages served from the rendered-HTML cache for guests
+CACHED_PAGES = ("home", "shop", "product")
+
+# Query args that change what a catalog page shows; anything else is ignored
+CACHE_QUERY_ARGS = ("sort", "category", "page", "after", "price_min", "price_max")
+
+PAGE_CACHE_TTL = 60 * 60
+PAGE_CACHE_TAGS = ("catalog", "settings")
+
+
+class CatalogPageRenderer(TemplatePage):
+    """Serve guest catalog pages from a rendered-HTML cache.
+
+    Pages are keyed by URL path, language, currency and the normalised
+    catalog query args, and invalidated through the "catalog" and
+    "settings" cache tags. Logged-in users always get a fresh render.
+    """
+
+    def can_render(self):
+        return (
+            self.path in CACHED_PAGES
+            and is_cacheable_request()
+            and super().can_render()
+        )
+
+    def render(self):
+        key = get_page_cache_key()
+        entry = frappe.cache().get_value(key)
+
+        if not entry:
+            # The page is shared by every URL with this key, so its language
+            # links may only carry the args in the key (not utm_*, fbclid, ...)
+            frappe.flags.lang_url_args = get_page_query_args()
+            try:
+                html = self.get_html()
+            finally:
+                frappe.flags.lang_url_args = None
+            entry = {"html": html, "etag": '"{0}"'.format(hashlib.md5(frappe.safe_encode(html)).hexdigest())}
+            frappe.cache().set_value(key, entry, expires_in_sec=PAGE_CACHE_TTL)
+
+        headers = {
+            "ETag": entry["etag"],
+            # Let browsers keep the page but revalidate it with If-None-Match
+            "Cache-Control": "no-cache",
+        }
+        if not get_path_lang():
+            # Unprefixed URLs take the language from the lang cookie
+            headers["Vary"] = "Cookie"
+
+        if entry["etag"] in get_if_none_match():
+            return self.build_response("", http_status_code=304, headers=headers)
+
+        return self.build_response(self.add_csrf_token(entry["html"]), headers=headers)
+
+
+def is_cacheable_request():
+    """Only anonymous GET requests (and not previews) are cached"""
+    request = getattr(frappe.local, "request", None)
+    return bool(
+        request
+        and request.method in ("GET", "HEAD")
+        and frappe.session.user == "Guest"
+        and not frappe.form_dict.get("preview")
+    )
+
+
+def get_page_query_args():
+    """(arg, normalised value) of the current request's catalog query args"""
+    request = frappe.local.request
+    args = []
+    for arg in CACHE_QUERY_ARGS:
+        value = (request.args.get(arg) or "").strip()
+        if value:
+            args.append((arg, normalize_query_value(arg, value)))
+    return args
+
+
+def get_page_cache_key():
+    """Cache key for the current request's catalog page"""
+    request = frappe.local.request
+    args = [f"{arg}={value}" for arg, value in get_page_query_args()]
+
+    parts = [
+        get_tag_versions(PAGE_CACHE_TAGS),
+        request.path.rstrip("/") or "/",
+        get_lang(),
+        get_store_settings().currency or "",
+        "&".join(args),
+    ]
+    return "garval_page:" + hashlib.md5("|".join(parts).encode()).hexdigest()
+
+
+def normalize_query_value(arg, value):
+    """Normalise numeric args so ?page=02 and ?page=2 share a cache entry"""
+    try:
+        if arg == "page":
+            return str(int(value))
+        if arg in ("price_min", "price_max"):
+            return f"{float(value):g}"
+    except ValueError:
+        pass
+    return value
+
+
+def get_if_none_match():
+    """ETags sent by the client in If-None-Match"""
+    header = frappe.local.request.headers.get("If-None-Match") or ""
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
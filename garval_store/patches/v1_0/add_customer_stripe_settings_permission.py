@@ -0,0 +1,15 @@
+import frappe
+from frappe.permissions import add_permission
+
+
+def execute():
+    """Let the Customer role read Stripe Settings, which card checkout needs.
+
+    This used to be checked (and the whole cache cleared) on every login.
+    """
+    if not frappe.db.exists("DocType", "Stripe Settings") or not frappe.db.exists("Role", "Customer"):
+        return
+
+    # Copies the standard permissions to Custom DocPerm first, so other roles keep their access
+    add_permission("Stripe Settings", "Customer", permlevel=0, ptype="read")
+    frappe.clear_cache(doctype="Stripe Settings")
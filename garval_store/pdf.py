@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import frappe
+
+# Print format PDFs (invoices) are rendered by background jobs and cached on
+# disk under the site's private/garval_pdf directory, keyed by
+# (doctype, name, modified, print format, language). A document that changes
+# gets a new key, so cached files never go stale; PDF_CACHE_MAX_FILES bounds
+# the directory.
+
+PDF_CACHE_DIR = "garval_pdf"
+PDF_CACHE_MAX_FILES = 2000
+DEFAULT_PRINT_FORMAT = "Standard"
+
+# Dedicated RQ queue, configured under "workers" in common_site_config.json.
+# Renders fall back to the "long" queue until it is configured, so they never
+# hold up the short jobs of the request path.
+PDF_QUEUE = "garval_pdf"
+
+
+def get_pdf_queue():
+    """Queue for PDF render jobs"""
+    workers = frappe.get_conf().get("workers") or {}
+    return PDF_QUEUE if PDF_QUEUE in workers else "long"
+
+
+def get_pdf_path(doctype, name, print_format=None, lang=None):
+    """Cache file of the current version of a document's PDF, or None if the document doesn't exist"""
+    modified = frappe.db.get_value(doctype, name, "modified")
+    if not modified:
+        return None
+
+    key = f"{doctype}:{name}:{modified}:{print_format or DEFAULT_PRINT_FORMAT}:{lang or 'es'}"
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return frappe.get_site_path("private", PDF_CACHE_DIR, f"{digest}.pdf")
+
+
+def get_cached_pdf(doctype, name, print_format=None, lang=None):
+    """Cached PDF bytes, or None if it hasn't been rendered yet"""
+    path = get_pdf_path(doctype, name, print_format, lang)
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def get_pdf(doctype, name, print_format=None, lang=None):
+    """PDF bytes of a document, rendering it if it isn't cached. Call from background jobs."""
+    return get_cached_pdf(doctype, name, print_format, lang) or render_pdf(doctype, name, print_format, lang)
+
+
+def enqueue_pdf(doctype, name, print_format=None, lang=None):
+    """Queue a render of a document's PDF unless it is cached; returns True when it is ready"""
+    if get_cached_pdf(doctype, name, print_format, lang) is not None:
+        return True
+
+    frappe.enqueue(
+        "garval_store.pdf.render_pdf",
+        queue=get_pdf_queue(),
+        job_id=f"garval_store::pdf::{doctype}::{name}::{print_format or DEFAULT_PRINT_FORMAT}::{lang or 'es'}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        doctype=doctype,
+        name=name,
+        print_format=print_format,
+        lang=lang
+    )
+    return False
+
+
+def render_pdf(doctype, name, print_format=None, lang=None):
+    """Background job: render a document's PDF into the cache and return it"""
+    path = get_pdf_path(doctype, name, print_format, lang)
+    if not path:
+        return None
+
+    current_lang = getattr(frappe.local, "lang", None)
+    try:
+        frappe.local.lang = lang or "es"
+        pdf = frappe.get_print(doctype, name, print_format or DEFAULT_PRINT_FORMAT, as_pdf=True)
+    finally:
+        frappe.local.lang = current_lang
+
+    # Write atomically so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+
+    prune_pdf_cache(os.path.dirname(path))
+    return pdf
+
+
+def prune_pdf_cache(directory):
+    """Remove the oldest cached PDFs beyond PDF_CACHE_MAX_FILES"""
+    files = [entry for entry in os.scandir(directory) if entry.name.endswith(".pdf")]
+    if len(files) <= PDF_CACHE_MAX_FILES:
+        return
+
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:len(files) - PDF_CACHE_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,241 @@
+import frappe
+
+from garval_store.cache import invalidate_tags
+from garval_store.utils import get_default_price_list, get_item_prices, get_stock_availability
+
+PRODUCT_CARD_DOCTYPE = "Garval Product Card"
+
+
+def build_product_cards(item_codes):
+    """Build card values for published products among item_codes.
+
+    Reads sources in a fixed number of queries regardless of how many items
+    are passed. Returns a dict keyed by item_code; unpublished items are left out.
+    """
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    if not item_codes:
+        return {}
+
+    is_website_item = frappe.db.exists("DocType", "Website Item")
+    if is_website_item:
+        sources = frappe.get_all(
+            "Website Item",
+            filters={"item_code": ["in", item_codes], "published": 1},
+            fields=[
+                "name", "item_code", "item_name", "web_item_name", "item_group",
+                "short_description", "web_long_description", "website_image", "route",
+                "website_warehouse", "on_backorder", "ranking", "stock_uom",
+                "creation", "modified"
+            ]
+        )
+        # Fallback to Item image for Website Items without one
+        missing_images = [source.item_code for source in sources if not source.website_image]
+        item_images = {}
+        if missing_images:
+            item_images = dict(frappe.get_all(
+                "Item",
+                filters={"name": ["in", missing_images]},
+                fields=["name", "image"],
+                as_list=True
+            ))
+    else:
+        sources = frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes], "disabled": 0, "is_sales_item": 1, "show_in_website": 1},
+            fields=[
+                "name", "item_code", "item_name", "item_group", "description",
+                "image", "stock_uom", "creation", "modified"
+            ]
+        )
+
+    prices = get_item_prices([source.item_code for source in sources])
+    stock = get_stock_availability(sources)
+
+    cards = {}
+    for source in sources:
+        card = frappe._dict({
+            "item_code": source.item_code,
+            "item_name": source.item_name,
+            "item_group": source.item_group,
+            "stock_uom": source.stock_uom,
+            "source_creation": source.creation,
+            "source_modified": source.modified,
+            "price": prices[source.item_code]["price"],
+            "formatted_price": prices[source.item_code]["formatted_price"],
+            "in_stock": 1 if stock[source.item_code].in_stock else 0
+        })
+        if is_website_item:
+            card.update({
+                "website_item": source.name,
+                "slug": source.route or source.item_code,
+                "display_name": source.web_item_name or source.item_name,
+                "image": source.website_image or item_images.get(source.item_code),
+                "ranking": source.ranking or 0,
+                "website_warehouse": source.website_warehouse,
+                "on_backorder": source.on_backorder or 0,
+                "short_description": source.short_description,
+                "description": source.web_long_description or source.short_description
+            })
+        else:
+            card.update({
+                "website_item": None,
+                "slug": source.item_code,
+                "display_name": source.item_name,
+                "image": source.image,
+                "ranking": 0,
+                "website_warehouse": None,
+                "on_backorder": 0,
+                "short_description": source.description[:200] if source.description else "",
+                "description": source.description
+            })
+        cards[source.item_code] = card
+
+    return cards
+
+
+def refresh_product_cards(item_codes):
+    """Rebuild the cards for item_codes, removing cards of unpublished items"""
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    if not item_codes:
+        return
+
+    cards = build_product_cards(item_codes)
+    existing = set(frappe.get_all(
+        PRODUCT_CARD_DOCTYPE,
+        filters={"name": ["in", item_codes]},
+        pluck="name"
+    ))
+
+    for item_code in item_codes:
+        card = cards.get(item_code)
+        if not card:
+            if item_code in existing:
+                frappe.db.delete(PRODUCT_CARD_DOCTYPE, {"name": item_code})
+            continue
+
+        if item_code in existing:
+            frappe.db.set_value(PRODUCT_CARD_DOCTYPE, item_code, card, update_modified=True)
+        else:
+            frappe.get_doc({"doctype": PRODUCT_CARD_DOCTYPE, **card}).insert(ignore_permissions=True)
+
+    invalidate_catalog()
+
+
+def rebuild_product_cards(chunk_size=500):
+    """Rebuild every product card in chunks and drop cards without a published source"""
+    source_doctype = "Website Item" if frappe.db.exists("DocType", "Website Item") else "Item"
+    field = "item_code" if source_doctype == "Website Item" else "name"
+
+    all_item_codes = frappe.get_all(source_doctype, fields=[field], order_by=f"{field} asc", pluck=field)
+
+    for start in range(0, len(all_item_codes), chunk_size):
+        refresh_product_cards(all_item_codes[start:start + chunk_size])
+        frappe.db.commit()
+
+    # Remove cards whose source no longer exists
+    stale = set(frappe.get_all(PRODUCT_CARD_DOCTYPE, pluck="name")) - set(all_item_codes)
+    if stale:
+        frappe.db.delete(PRODUCT_CARD_DOCTYPE, {"name": ["in", list(stale)]})
+        frappe.db.commit()
+        invalidate_catalog()
+
+    return len(all_item_codes)
+
+
+def invalidate_catalog():
+    """Expire cached catalog pages once the card changes are committed"""
+    invalidate_tags("catalog")
+    frappe.db.after_commit.add(lambda: invalidate_tags("catalog"))
+
+
+def enqueue_rebuild_product_cards():
+    """Queue a full rebuild, e.g. after price list or currency changes"""
+    frappe.enqueue(
+        "garval_store.product_cards.rebuild_product_cards",
+        queue="long",
+        job_id="garval_store::rebuild_product_cards",
+        deduplicate=True,
+        enqueue_after_commit=True
+    )
+
+
+# doc_events handlers
+
+def on_source_change(doc, method=None):
+    """Website Item / Item changed: refresh its card"""
+    refresh_product_cards([doc.get("item_code") or doc.name])
+
+
+def on_source_trash(doc, method=None):
+    """Website Item / Item deleted: drop its card"""
+    frappe.db.delete(PRODUCT_CARD_DOCTYPE, {"name": doc.get("item_code") or doc.name})
+    invalidate_catalog()
+
+
+def on_item_price_change(doc, method=None):
+    """Item Price changed or deleted: refresh the cards it is (or was) the active price of"""
+    price_list = get_default_price_list()
+    item_codes = set()
+    if doc.price_list == price_list:
+        item_codes.add(doc.item_code)
+
+    before = doc.get_doc_before_save() if method != "on_trash" else None
+    if before and before.price_list == price_list:
+        # Moved off the active price list, or to another item
+        item_codes.add(before.item_code)
+
+    if not item_codes:
+        return
+
+    if method == "on_trash":
+        # The price is still in the table until the delete is committed
+        frappe.enqueue(
+            "garval_store.product_cards.refresh_committed_cards",
+            queue="short",
+            enqueue_after_commit=True,
+            item_codes=sorted(item_codes)
+        )
+    else:
+        refresh_product_cards(sorted(item_codes))
+
+
+def on_stock_change(doc, method=None):
+    """Stock Ledger Entry submitted: refresh the card's stock flag once the posting is committed.
+
+    ERPNext submits each entry before it writes the Bin, so the cards can't
+    be rebuilt here. The items of the whole voucher are collected and
+    refreshed by one job queued after the commit. Cancellations post
+    reversal entries, so they arrive here too.
+    """
+    pending = getattr(frappe.local, "garval_stock_items", None)
+    if pending is None:
+        pending = frappe.local.garval_stock_items = set()
+        frappe.db.after_commit.add(_enqueue_stock_refresh)
+        frappe.db.after_rollback.add(_discard_stock_refresh)
+    pending.add(doc.item_code)
+
+
+def _enqueue_stock_refresh():
+    item_codes = sorted(getattr(frappe.local, "garval_stock_items", None) or [])
+    frappe.local.garval_stock_items = None
+    if item_codes:
+        frappe.enqueue(
+            "garval_store.product_cards.refresh_committed_cards",
+            queue="short",
+            item_codes=item_codes
+        )
+
+
+def _discard_stock_refresh():
+    frappe.local.garval_stock_items = None
+
+
+def refresh_committed_cards(item_codes):
+    """Background job: refresh cards after a committed stock posting or Item Price deletion"""
+    refresh_product_cards(item_codes)
+    frappe.db.commit()
+
+
+def on_pricing_settings_change(doc, method=None):
+    """Price List, selling price list or default currency changed: every card may be affected"""
+    enqueue_rebuild_product_cards()
@@ -223,15 +223,22 @@ const GarvalStore = {
             langOptions.forEach(option => {
                 option.addEventListener('click', (e) => {
                     e.preventDefault();
-                    const url = new URL(option.href);
-                    const lang = url.searchParams.get('lang');
-                    this.setLanguage(lang);
+                    this.setLanguage(option.dataset.lang);
                 });
             });
         },
 
         loadSavedLanguage: function() {
-            // Load saved language from cookie
+            // The cookie is only a hint for unprefixed URLs; /es/ and /en/ pages keep their
+            // language and remember it for the unprefixed links they contain
+            const pathLang = this.getPathLang();
+            if (pathLang) {
+                if (this.getCookie('lang') !== pathLang) {
+                    this.setCookie('lang', pathLang, 365);
+                }
+                return;
+            }
+
             const savedLang = this.getCookie('lang');
             if (savedLang && !window.location.search.includes('lang=')) {
                 const currentLang = document.documentElement.lang;
@@ -245,12 +252,22 @@ const GarvalStore = {
             // Save language choice to cookie (respects both ES and EN)
             this.setCookie('lang', lang, 365); // Save for 1 year
             
-            // Update URL with language parameter
+            // Go to the language-prefixed URL of the current page
             const url = new URL(window.location.href);
-            url.searchParams.set('lang', lang);
+            url.searchParams.delete('lang');
+            let path = url.pathname;
+            if (this.getPathLang()) {
+                path = path.replace(/^\/(es|en)(?=\/|$)/, '') || '/';
+            }
+            url.pathname = '/' + lang + (path === '/' ? '' : path);
             window.location.href = url.toString();
         },
 
+        getPathLang: function() {
+            const match = window.location.pathname.match(/^\/(es|en)(\/|$)/);
+            return match ? match[1] : null;
+        },
+
         getCookie: function(name) {
             const value = `; ${document.cookie}`;
             const parts = value.split(`; ${name}=`);
@@ -390,9 +407,46 @@ const GarvalStore = {
 
         clear: function() {
             this.items = [];
+            this.lines = {};
             this.saveCart();
         },
 
+        // Server view of each line from the last reprice, keyed by item id
+        lines: {},
+
+        reprice: async function(destination) {
+            // Validate and reprice the whole cart on the server in one call;
+            // pass {country, postal_code} to also get shipping options
+            if (this.items.length === 0) return null;
+
+            const payload = this.items.map(item => ({ id: item.id, quantity: item.quantity }));
+            const params = new URLSearchParams({ items: JSON.stringify(payload) });
+            if (destination && destination.country) {
+                params.set('country', destination.country);
+                params.set('postal_code', destination.postal_code || '');
+            }
+            try {
+                const response = await fetch(`${GarvalStore.config.apiBase}.cart.reprice?${params.toString()}`);
+                const result = await response.json();
+                if (!result.message || !result.message.success) return null;
+
+                const cart = result.message;
+                this.lines = {};
+                cart.items.forEach(line => {
+                    this.lines[line.item_code] = line;
+                    const item = this.items.find(item => item.id === line.item_code);
+                    // Keep the stored price in line with the server price
+                    if (item && line.price > 0) {
+                        item.price = line.price;
+                    }
+                });
+                this.saveCart();
+                return cart;
+            } catch (e) {
+                return null;
+            }
+        },
+
         refreshCartPage: function() {
             if (window.location.pathname.includes('/cart')) {
                 window.location.reload();
@@ -560,7 +614,7 @@ const GarvalStore = {
 
                     if (result.message && result.message.success) {
                         GarvalStore.Cart.clear();
-                        window.location.href = `/order-confirmation?order=${result.message.order_id}`;
+                        window.location.href = `/order-confirmation?order=${encodeURIComponent(result.message.order_id)}&token=${encodeURIComponent(result.message.view_token)}`;
                     } else {
                         GarvalStore.Forms.showMessage(form, 'error',
                             result.message?.error || 'Error al procesar el pedido');
@@ -706,6 +760,13 @@ const GarvalStore = {
             return `${GarvalStore.config.currency}${parseFloat(amount).toFixed(2)}`;
         },
 
+        escapeHtml: function(text) {
+            // Text from the server or the cart, safe to put in innerHTML
+            const div = document.createElement('div');
+            div.textContent = text == null ? '' : String(text);
+            return div.innerHTML;
+        },
+
         debounce: function(func, wait) {
             let timeout;
             return function executedFunction(...args) {
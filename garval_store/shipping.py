@@ -0,0 +1,263 @@
+import bisect
+
+import frappe
+from frappe import _
+
+from garval_store.cache import get_tag_versions
+
+# Shipping rates come from Garval Shipping Rate rows and enabled selling
+# Shipping Rules (Fixed or Net Weight). They are compiled into an in-memory
+# index per site:
+#
+#   country -> service -> postcode ranges sorted by start (bisect) -> weight bands sorted by upper bound (bisect)
+#
+# plus country-wide bands for rates without postcodes. Rates for any country
+# ("*") add to the country's services. Ranges of a country and service never
+# overlap (Garval Shipping Rate validates it), and postcodes are compared by
+# postcode_key. The index is rebuilt when the "shipping_rates" cache tag changes.
+
+SHIPPING_TAGS = ("shipping_rates",)
+ANY_COUNTRY = "*"
+
+# Used until any shipping rate is configured
+DEFAULT_SHIPPING_RATES = {
+    "Spain": {"standard": 0, "express": 5.99},  # Free shipping in Spain
+    "Portugal": {"standard": 4.99, "express": 9.99},
+    "France": {"standard": 7.99, "express": 14.99},
+    "Germany": {"standard": 9.99, "express": 17.99},
+    "Italy": {"standard": 9.99, "express": 17.99},
+    "default": {"standard": 14.99, "express": 24.99}
+}
+DEFAULT_DELIVERY_DAYS = {"standard": "5-7", "express": "2-3"}
+
+# Conversion of Item weight UOMs to kg
+WEIGHT_UOM_TO_KG = {"kg": 1, "gram": 0.001, "g": 0.001, "gm": 0.001, "pound": 0.45359237, "lb": 0.45359237, "ounce": 0.028349523}
+
+# All-digit postcodes are zero-padded to this width, so "8001" sorts as 08001
+POSTCODE_WIDTH = 10
+
+# site -> (tag versions, index)
+_indexes = {}
+
+
+def get_service_name(service):
+    """Customer-facing name of a built-in service"""
+    return {"standard": _("Standard Shipping"), "express": _("Express Shipping")}.get(service, service)
+
+
+def postcode_key(postcode):
+    """Comparable form of a postcode: no spaces, upper case, all-digit codes zero-padded"""
+    postcode = (postcode or "").replace(" ", "").strip().upper()
+    if postcode.isdigit():
+        return postcode.zfill(POSTCODE_WIDTH)
+    return postcode
+
+
+def get_shipping_index():
+    """The site's shipping index, rebuilt after shipping rates change"""
+    site = getattr(frappe.local, "site", None)
+    versions = get_tag_versions(SHIPPING_TAGS)
+    entry = _indexes.get(site)
+    if not entry or entry[0] != versions:
+        entry = (versions, build_shipping_index())
+        _indexes[site] = entry
+    return entry[1]
+
+
+def build_shipping_index():
+    """Load all shipping rates into country -> postcode ranges -> weight bands"""
+    rates = frappe.get_all(
+        "Garval Shipping Rate",
+        filters={"enabled": 1},
+        fields=[
+            "service", "service_name", "delivery_days", "country",
+            "postcode_from", "postcode_to", "weight_from", "weight_to", "price"
+        ]
+    )
+    rates += get_shipping_rule_rates()
+
+    countries = {}
+    for rate in rates:
+        service = countries.setdefault(rate.country or ANY_COUNTRY, {}).setdefault(
+            rate.service, {"ranges": {}, "default": []}
+        )
+        if rate.postcode_from:
+            bands = service["ranges"].setdefault((postcode_key(rate.postcode_from), postcode_key(rate.postcode_to)), [])
+        else:
+            bands = service["default"]
+        bands.append({
+            "service": rate.service,
+            "name": rate.service_name,
+            "days": rate.delivery_days,
+            "weight_from": rate.weight_from or 0,
+            "weight_to": rate.weight_to or float("inf"),
+            "price": rate.price or 0,
+            "shipping_rule": rate.shipping_rule
+        })
+
+    index = {}
+    for country, services in countries.items():
+        index[country] = {}
+        for service, data in services.items():
+            ranges = sorted(data["ranges"].items())
+            index[country][service] = {
+                "starts": [start for (start, _end), _bands in ranges],
+                "ranges": [(start, end, compile_bands(bands)) for (start, end), bands in ranges],
+                "default": compile_bands(data["default"])
+            }
+    return index
+
+
+def compile_bands(bands):
+    """Sort weight bands by upper bound for bisect lookups"""
+    bands = sorted(bands, key=lambda band: band["weight_to"])
+    return ([band["weight_to"] for band in bands], bands)
+
+
+def get_shipping_rule_rates():
+    """Rates from enabled selling Shipping Rules based on a fixed amount or net weight"""
+    if not frappe.db.exists("DocType", "Shipping Rule"):
+        return []
+
+    rules = frappe.get_all(
+        "Shipping Rule",
+        filters={"disabled": 0, "shipping_rule_type": "Selling", "calculate_based_on": ["in", ["Fixed", "Net Weight"]]},
+        fields=["name", "label", "calculate_based_on", "shipping_amount"]
+    )
+    if not rules:
+        return []
+
+    names = [rule.name for rule in rules]
+    countries = {}
+    for row in frappe.get_all(
+        "Shipping Rule Country",
+        filters={"parent": ["in", names], "parenttype": "Shipping Rule"},
+        fields=["parent", "country"]
+    ):
+        countries.setdefault(row.parent, []).append(row.country)
+
+    conditions = {}
+    for row in frappe.get_all(
+        "Shipping Rule Condition",
+        filters={"parent": ["in", names], "parenttype": "Shipping Rule"},
+        fields=["parent", "from_value", "to_value", "shipping_amount"]
+    ):
+        conditions.setdefault(row.parent, []).append(row)
+
+    rates = []
+    for rule in rules:
+        if rule.calculate_based_on == "Net Weight":
+            bands = [(row.from_value, row.to_value, row.shipping_amount) for row in conditions.get(rule.name, [])]
+        else:
+            bands = [(0, 0, rule.shipping_amount)]
+
+        # Rules without countries apply everywhere
+        for country in countries.get(rule.name) or [None]:
+            for weight_from, weight_to, price in bands:
+                rates.append(frappe._dict({
+                    "service": rule.name,
+                    "service_name": rule.label or rule.name,
+                    "shipping_rule": rule.name,
+                    "country": country,
+                    "weight_from": weight_from,
+                    "weight_to": weight_to,
+                    "price": price
+                }))
+    return rates
+
+
+def find_band(compiled, weight):
+    """Weight band containing weight, or None"""
+    uppers, bands = compiled
+    i = bisect.bisect_left(uppers, weight)
+    if i < len(bands) and bands[i]["weight_from"] <= weight:
+        return bands[i]
+    return None
+
+
+def find_service_band(entry, postal_code, weight):
+    """Band of a service for a postcode key and weight; a postcode range overrides the country-wide rate"""
+    if postal_code and entry["starts"]:
+        i = bisect.bisect_right(entry["starts"], postal_code) - 1
+        if i >= 0 and postal_code <= entry["ranges"][i][1]:
+            band = find_band(entry["ranges"][i][2], weight)
+            if band:
+                return band
+    return find_band(entry["default"], weight)
+
+
+def get_rates(country, postal_code=None, weight=0):
+    """Shipping options for a destination and parcel weight (kg), cheapest first"""
+    index = get_shipping_index()
+
+    if not index:
+        rates = DEFAULT_SHIPPING_RATES.get(country, DEFAULT_SHIPPING_RATES["default"])
+        return [
+            {"id": service, "name": get_service_name(service), "price": price, "days": DEFAULT_DELIVERY_DAYS[service]}
+            for service, price in rates.items()
+        ]
+
+    # The country's services, then those for any country
+    country_services = index.get(country, {})
+    any_services = index.get(ANY_COUNTRY, {})
+    postal_code = postcode_key(postal_code)
+
+    options = []
+    for service in dict.fromkeys(list(country_services) + list(any_services)):
+        band = None
+        if service in country_services:
+            band = find_service_band(country_services[service], postal_code, weight)
+        if not band and service in any_services:
+            band = find_service_band(any_services[service], postal_code, weight)
+        if band:
+            options.append({
+                "id": service,
+                "name": band["name"] or get_service_name(service),
+                "price": band["price"],
+                "days": band["days"] or DEFAULT_DELIVERY_DAYS.get(service, ""),
+                # Set for rates from a Shipping Rule, which the Sales Order applies itself
+                "shipping_rule": band["shipping_rule"]
+            })
+
+    return sorted(options, key=lambda option: option["price"])
+
+
+def select_rate(rates, service=None):
+    """The rate of the chosen service, else the cheapest; None without rates"""
+    if service:
+        for rate in rates:
+            if rate["id"] == service:
+                return rate
+    return rates[0] if rates else None
+
+
+def weight_in_kg(weight_per_unit, weight_uom):
+    """Item weight in kg; weights without a known UOM are taken as kg"""
+    return (weight_per_unit or 0) * WEIGHT_UOM_TO_KG.get((weight_uom or "kg").lower(), 1)
+
+
+def get_cart_weight(cart_lines, item_weights=None):
+    """Total weight in kg of (item_code, qty) lines.
+
+    item_weights maps item_code to an object with weight_per_unit and
+    weight_uom; the Items are read in one query when it isn't passed.
+    """
+    if item_weights is None:
+        item_codes = list(dict.fromkeys(item_code for item_code, _qty in cart_lines if item_code))
+        item_weights = {}
+        if item_codes:
+            item_weights = {
+                item.name: item
+                for item in frappe.get_all(
+                    "Item",
+                    filters={"name": ["in", item_codes]},
+                    fields=["name", "weight_per_unit", "weight_uom"]
+                )
+            }
+
+    weight = 0
+    for item_code, qty in cart_lines:
+        item = item_weights.get(item_code)
+        if item:
+            weight += weight_in_kg(item.weight_per_unit, item.weight_uom) * qty
+    return weight
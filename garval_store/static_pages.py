@@ -0,0 +1,113 @@
+import os
+
+import frappe
+from frappe.website.page_renderers.template_page import TemplatePage
+
+from garval_store.page_cache import get_if_none_match
+from garval_store.utils import get_lang, get_path_lang
+
+# Pages whose content only depends on the language: public route -> www endpoint
+STATIC_PAGES = {
+    "about": "about",
+    "aviso-legal": "aviso_legal",
+    "politica-privacidad": "politica_privacidad",
+    "politica-cookies": "politica_cookies",
+    "declaracion-accesibilidad": "declaracion_accesibilidad",
+}
+STATIC_PAGE_LANGS = ("es", "en")
+
+# Served from sites/<site>/public/garval_static/<lang>/<route>.html
+STATIC_PAGES_DIR = "garval_static"
+STATIC_PAGE_MAX_AGE = 24 * 60 * 60
+
+
+def get_static_page_path(lang, route):
+    """Path of the pre-rendered file for a page and language"""
+    return frappe.get_site_path("public", STATIC_PAGES_DIR, lang, f"{route}.html")
+
+
+def prerender_static_pages():
+    """Render every static page in every language to HTML files.
+
+    Runs at deploy time (after migrate or via `bench prerender-static-pages`)
+    so requests for these pages never go through Jinja.
+    """
+    from frappe.utils import set_request
+    from frappe.website.serve import get_response_content
+
+    current_user = frappe.session.user if getattr(frappe.local, "session", None) else None
+    current_lang = getattr(frappe.local, "lang", None)
+    frappe.set_user("Guest")
+    frappe.flags.garval_prerendering = True
+
+    written = []
+    try:
+        for route in STATIC_PAGES:
+            for lang in STATIC_PAGE_LANGS:
+                set_request(method="GET", path=f"/{route}", query_string=f"lang={lang}")
+                html = get_response_content(route)
+
+                path = get_static_page_path(lang, route)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so a request never sees a half-written file
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(html)
+                os.replace(tmp_path, path)
+                written.append(path)
+    finally:
+        frappe.flags.garval_prerendering = False
+        frappe.local.request = None
+        frappe.local.lang = current_lang
+        if current_user:
+            frappe.set_user(current_user)
+
+    return written
+
+
+def prerender_static_pages_after_migrate():
+    """after_migrate hook: never let a rendering error fail the migrate"""
+    try:
+        prerender_static_pages()
+    except Exception as e:
+        frappe.log_error(f"Error pre-rendering static pages: {str(e)}")
+
+
+class StaticPageRenderer(TemplatePage):
+    """Serve the legal and about pages from their pre-rendered files.
+
+    Falls back to the regular template render when a page hasn't been
+    pre-rendered yet.
+    """
+
+    def can_render(self):
+        if self.path not in STATIC_PAGES.values() or frappe.flags.garval_prerendering:
+            return False
+        request = getattr(frappe.local, "request", None)
+        if not request or request.method not in ("GET", "HEAD"):
+            return False
+        return os.path.exists(self.get_file_path())
+
+    def get_file_path(self):
+        route = next(route for route, endpoint in STATIC_PAGES.items() if endpoint == self.path)
+        return get_static_page_path(get_lang(), route)
+
+    def render(self):
+        path = self.get_file_path()
+        stat = os.stat(path)
+        etag = '"{0:x}-{1:x}"'.format(stat.st_mtime_ns, stat.st_size)
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={STATIC_PAGE_MAX_AGE}",
+        }
+        if not get_path_lang():
+            # Unprefixed URLs take the language from the lang cookie
+            headers["Vary"] = "Cookie"
+
+        if etag in get_if_none_match():
+            return self.build_response("", http_status_code=304, headers=headers)
+
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        return self.build_response(html, headers=headers)
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from garval_store.idempotency import order_lock
+from garval_store.order_cancellation import (
+    CANCELLATION_DOCTYPE,
+    CANCELLATION_MAX_ATTEMPTS,
+    run_cancellation
+)
+
+
+class TestOrderCancellation(FrappeTestCase):
+    def setUp(self):
+        self.sales_orders = []
+
+    def tearDown(self):
+        # The cancellation job commits, so remove what the test created
+        for sales_order in self.sales_orders:
+            frappe.delete_doc(CANCELLATION_DOCTYPE, sales_order, force=True, ignore_missing=True)
+            so = frappe.get_doc("Sales Order", sales_order)
+            if so.docstatus == 1:
+                so.cancel()
+            frappe.delete_doc("Sales Order", sales_order, force=True)
+        frappe.db.commit()
+
+    def make_sales_order(self):
+        from erpnext.selling.doctype.sales_order.test_sales_order import make_sales_order
+
+        sales_order = make_sales_order().name
+        self.sales_orders.append(sales_order)
+        return sales_order
+
+    def make_cancellation(self):
+        sales_order = self.make_sales_order()
+        frappe.get_doc({
+            "doctype": CANCELLATION_DOCTYPE,
+            "sales_order": sales_order,
+            "status": "Queued",
+            "requested_by": "Administrator"
+        }).insert(ignore_permissions=True)
+        return sales_order
+
+    def test_cancel_order_does_not_clear_cache(self):
+        from garval_store.api.orders import cancel_order
+
+        sales_order = self.make_sales_order()
+        customer = frappe.db.get_value("Sales Order", sales_order, "customer")
+
+        with patch("frappe.clear_cache") as clear_cache, \
+                patch("garval_store.api.orders.get_customer_from_user", return_value=customer):
+            result = cancel_order(sales_order)
+            self.assertTrue(result["success"])
+            self.assertEqual(frappe.db.get_value(CANCELLATION_DOCTYPE, sales_order, "status"), "Queued")
+
+            # The job queued by the request
+            run_cancellation(sales_order)
+
+        clear_cache.assert_not_called()
+        self.assertEqual(frappe.db.get_value(CANCELLATION_DOCTYPE, sales_order, "status"), "Cancelled")
+        self.assertEqual(frappe.db.get_value("Sales Order", sales_order, "docstatus"), 2)
+
+    def test_locked_order_is_retried_then_failed(self):
+        sales_order = self.make_cancellation()
+
+        with patch("garval_store.order_cancellation.CANCELLATION_LOCK_WAIT", 0), \
+                order_lock(sales_order, timeout=60, wait=0):
+            run_cancellation(sales_order)
+
+            cancellation = frappe.db.get_value(
+                CANCELLATION_DOCTYPE, sales_order, ["status", "attempts", "retry_after"], as_dict=True
+            )
+            self.assertEqual(cancellation.attempts, 1)
+            self.assertTrue(cancellation.retry_after)
+
+            for _attempt in range(CANCELLATION_MAX_ATTEMPTS - 1):
+                run_cancellation(sales_order)
+
+        self.assertEqual(frappe.db.get_value(CANCELLATION_DOCTYPE, sales_order, "status"), "Failed")
+        self.assertEqual(frappe.db.get_value("Sales Order", sales_order, "docstatus"), 1)
@@ -15,14 +15,16 @@ def on_user_login(login_manager):
     try:
         # Only auto-verify email for actual SSO users (those with social login configured)
         # Regular email/password users must verify via the email link
-        if not frappe.db.get_value("User", user, "email_verified"):
+        from garval_store.commerce_context import clear_commerce_context, get_commerce_context
+        if not get_commerce_context(user).email_verified:
             # Check if user has any social login configured
             has_social_login = frappe.db.exists("User Social Login", {"parent": user})
             if has_social_login:
                 frappe.db.set_value("User", user, "email_verified", 1, update_modified=False)
+                clear_commerce_context(user)
 
         # Check if customer already exists for this user
-        from garval_store.utils import get_customer_from_user
+        from garval_store.utils import get_customer_from_user, get_store_settings
         customer = get_customer_from_user(user)
 
         if customer:
@@ -37,8 +39,8 @@ def on_user_login(login_manager):
             "doctype": "Customer",
             "customer_name": full_name,
             "customer_type": "Individual",
-            "customer_group": frappe.db.get_single_value("Selling Settings", "customer_group") or "Individual",
-            "territory": frappe.db.get_single_value("Selling Settings", "territory") or "All Territories",
+            "customer_group": get_store_settings().customer_group,
+            "territory": get_store_settings().territory,
             "email_id": user
         })
         customer.insert(ignore_permissions=True)
@@ -1,5 +1,6 @@
 import frappe
 from frappe import _
+from garval_store.cache import cached
 
 def update_website_context(context):
     """Update website context - used to exclude CSS from Frappe default pages"""
@@ -79,11 +80,58 @@ body[data-path="stripe_checkout"] .page-breadcrumbs {
     # Add currency symbol to all pages
     context['currency_symbol'] = get_currency_symbol()
 
+    # Language-prefixed alternates of this page, for hreflang links and the language switcher
+    if not is_frappe_page and frappe.request:
+        context['lang_urls'] = get_lang_urls()
+
+SUPPORTED_LANGS = ("es", "en")
+
+def get_path_lang(path=None):
+    """Language from a /es/... or /en/... URL prefix, or None for unprefixed URLs"""
+    if path is None:
+        path = frappe.request.path if frappe.request else ""
+    prefix = path.strip("/").split("/", 1)[0]
+    return prefix if prefix in SUPPORTED_LANGS else None
+
+def strip_lang_prefix(path):
+    """Path without its language prefix, e.g. /en/shop -> /shop and /es -> /"""
+    if not get_path_lang(path):
+        return path or "/"
+    rest = path.strip("/").split("/", 1)
+    return "/" + rest[1] if len(rest) > 1 else "/"
+
+def get_lang_urls(path=None):
+    """Absolute URLs of the current page in every language, plus the unprefixed x-default.
+
+    The query string keeps the request args except lang, or only
+    frappe.flags.lang_url_args when set (cached catalog pages).
+    """
+    from urllib.parse import urlencode
+    from frappe.utils import get_url
+
+    if path is None:
+        path = frappe.request.path if frappe.request else "/"
+    path = strip_lang_prefix(path)
+
+    query = ""
+    args = frappe.flags.lang_url_args
+    if args is None and frappe.request and frappe.request.args:
+        args = [(key, value) for key, value in frappe.request.args.items(multi=True) if key != "lang"]
+    if args:
+        query = "?" + urlencode(args)
+
+    urls = {lang: get_url(f"/{lang}" + (path if path != "/" else "") + query) for lang in SUPPORTED_LANGS}
+    urls["x-default"] = get_url(path + query)
+    return urls
+
 def get_lang():
-    """Get current language from request or cookies. Defaults to ES (Spanish)."""
-    lang = None
+    """Get current language from the URL prefix, request or cookies. Defaults to ES (Spanish)."""
+    # A /es/ or /en/ prefix always wins, so prefixed pages are cacheable by URL alone
+    lang = get_path_lang()
+    if lang:
+        return lang
 
-    # Try from URL parameter first
+    # Try from URL parameter
     if frappe.request and frappe.request.args:
         lang = frappe.request.args.get('lang')
 
@@ -95,7 +143,7 @@ def get_lang():
             pass
 
     # Default to Spanish (ES) if no valid language found
-    if not lang or lang not in ['es', 'en']:
+    if not lang or lang not in SUPPORTED_LANGS:
         lang = 'es'
 
     return lang
@@ -108,175 +156,194 @@ def set_lang():
     frappe.local.lang = lang
     return lang
 
+@cached("settings", ttl=3600)
+def _load_store_settings():
+    """Read the singleton settings the storefront depends on"""
+    company = frappe.db.get_single_value("Global Defaults", "default_company")
+    if not company:
+        company = frappe.get_all("Company", limit=1)
+        company = company[0].name if company else None
+
+    if company:
+        currency = frappe.db.get_value("Company", company, "default_currency")
+    else:
+        currency = frappe.db.get_single_value("Global Defaults", "default_currency")
+    symbol = frappe.db.get_value("Currency", currency, "symbol") if currency else None
+
+    price_list = frappe.db.get_single_value("Selling Settings", "selling_price_list")
+    if not price_list:
+        price_list = frappe.db.get_value("Price List", {"selling": 1, "enabled": 1}, "name")
+
+    return {
+        "company": company,
+        "currency": currency,
+        # Fallback to currency code if symbol not found
+        "currency_symbol": symbol or currency or "€",
+        "selling_price_list": price_list,
+        "default_warehouse": frappe.db.get_single_value("Stock Settings", "default_warehouse"),
+        "customer_group": frappe.db.get_single_value("Selling Settings", "customer_group") or "Individual",
+        "territory": frappe.db.get_single_value("Selling Settings", "territory") or "All Territories"
+    }
+
+def get_store_settings():
+    """Get the settings snapshot for the current request.
+
+    Loaded once per request and shared across requests through the cache;
+    saving Global Defaults, Selling Settings, Stock Settings, Company,
+    Currency or Price List invalidates it.
+    """
+    settings = getattr(frappe.local, "garval_store_settings", None)
+    if settings is None:
+        settings = frappe.local.garval_store_settings = frappe._dict(_load_store_settings())
+    return settings
+
+def clear_store_settings(doc=None, method=None):
+    """doc_events handler: drop the snapshot held by the current request"""
+    frappe.local.garval_store_settings = None
+
+@cached("settings", ttl=3600)
+def _get_company_currency_symbol(company):
+    currency = frappe.db.get_value("Company", company, "default_currency")
+    symbol = frappe.db.get_value("Currency", currency, "symbol") if currency else None
+    return symbol or currency or "€"
+
 def get_currency_symbol(company=None):
     """Get currency symbol for the given company or default company"""
     try:
-        if not company:
-            company = frappe.db.get_single_value("Global Defaults", "default_company")
-        if not company:
-            company = frappe.get_all("Company", limit=1)
-            company = company[0].name if company else None
-        
-        if company:
-            currency = frappe.db.get_value("Company", company, "default_currency", cache=True)
-        else:
-            currency = frappe.db.get_single_value("Global Defaults", "default_currency")
-        
-        if currency:
-            symbol = frappe.db.get_value("Currency", currency, "symbol", cache=True)
-            if symbol:
-                return symbol
-        
-        # Fallback to currency code if symbol not found
-        return currency or "€"
+        if not company or company == get_store_settings().company:
+            return get_store_settings().currency_symbol
+        return _get_company_currency_symbol(company)
     except Exception:
         return "€"
 
-def format_currency(amount, company=None):
+def format_currency(amount, company=None, symbol=None):
     """Format amount with currency symbol"""
-    symbol = get_currency_symbol(company)
+    if not symbol:
+        symbol = get_currency_symbol(company)
     return f"{symbol}{float(amount):.2f}"
 
+def _card_to_product(card):
+    """Shape a Garval Product Card row the way catalog templates expect"""
+    card.name = card.display_name
+    card.description = card.short_description
+    card.out_of_stock = not card.in_stock
+    card.price = float(card.price or 0)
+    return card
+
 def get_featured_products(limit=4):
-    """Get featured products from ERPNext Items"""
+    """Get featured products from the product card read model"""
     try:
-        # Try Website Item first (ERPNext e-commerce)
-        if frappe.db.exists("DocType", "Website Item"):
-            products = frappe.get_all(
-                "Website Item",
-                filters={
-                    "published": 1,
-                },
-                fields=[
-                    "name", "item_code", "item_name", "web_item_name",
-                    "short_description", "website_image", "route",
-                    "website_warehouse", "on_backorder"
-                ],
-                order_by="ranking desc, modified desc",
-                limit=limit
-            )
-
-            for product in products:
-                product.slug = product.route or product.item_code
-                product.name = product.web_item_name or product.item_name
-                # Get image from Website Item, fallback to Item image
-                product.image = product.website_image
-                if not product.image:
-                    item_image = frappe.db.get_value("Item", product.item_code, "image")
-                    product.image = item_image
-                product.description = product.short_description
-                # Check stock if warehouse is specified
-                product.out_of_stock = False
-                if product.get('website_warehouse'):
-                    product.out_of_stock = not has_stock(product.item_code, product.website_warehouse)
-                elif product.get('on_backorder'):
-                    product.out_of_stock = False  # Allow backorders
-
-                # Get price
-                price_info = get_item_price(product.item_code)
-                product.price = price_info.get('price', 0)
-                company = frappe.db.get_single_value("Global Defaults", "default_company")
-                product.formatted_price = price_info.get('formatted_price', format_currency(0, company))
-
-            return products
-
-        # Fallback to regular Items
         products = frappe.get_all(
-            "Item",
-            filters={
-                "disabled": 0,
-                "is_sales_item": 1,
-                "show_in_website": 1
-            },
+            "Garval Product Card",
             fields=[
-                "name", "item_code", "item_name", "description",
-                "image", "stock_uom"
+                "item_code", "slug", "display_name", "short_description",
+                "image", "price", "formatted_price", "in_stock"
             ],
-            order_by="modified desc",
+            order_by="ranking desc, source_modified desc",
             limit=limit
         )
+        return [_card_to_product(product) for product in products]
 
-        for product in products:
-            product.slug = product.item_code
-            product.name = product.item_name
-            product.out_of_stock = not has_stock(product.item_code)
+    except Exception as e:
+        frappe.log_error(f"Error fetching products: {str(e)}")
+        return []
 
-            price_info = get_item_price(product.item_code)
-            product.price = price_info.get('price', 0)
-            product.formatted_price = price_info.get('formatted_price', '€0.00')
+def _get_product_query(filters=None):
+    """Build the shop listing query shared by get_all_products and count_products.
 
-        return products
+    Returns the product card table and a query over it restricted to
+    products matching `filters` (item group and price range).
+    """
+    table = frappe.qb.DocType("Garval Product Card")
+    query = frappe.qb.from_(table)
+
+    # Apply custom filters
+    filters = filters or {}
+    if filters.get('item_group'):
+        query = query.where(table.item_group == filters.get('item_group'))
+    if filters.get('price_min'):
+        query = query.where(table.price >= float(filters.get('price_min')))
+    if filters.get('price_max'):
+        query = query.where(table.price <= float(filters.get('price_max')))
+
+    return table, query
+
+def count_products(filters=None):
+    """Count products matching the shop filters with a single COUNT(*)"""
+    from frappe.query_builder.functions import Count
 
+    try:
+        _table, query = _get_product_query(filters)
+        return query.select(Count("*")).run()[0][0]
     except Exception as e:
-        frappe.log_error(f"Error fetching products: {str(e)}")
-        return []
+        frappe.log_error(f"Error counting products: {str(e)}")
+        return 0
+
+def encode_product_cursor(sort_value, name):
+    """Encode a keyset pagination cursor for the shop listing"""
+    import base64
+    import json
+
+    payload = json.dumps([str(sort_value) if sort_value is not None else None, name])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_product_cursor(cursor):
+    """Decode a cursor from encode_product_cursor. Returns None if invalid."""
+    import base64
+    import json
 
-def get_all_products(filters=None, limit=20, offset=0, sort_by="modified", sort_order="desc"):
-    """Get all products with filters for shop page"""
     try:
-        base_filters = {"disabled": 0, "is_sales_item": 1}
-
-        if frappe.db.exists("DocType", "Website Item"):
-            base_filters = {"published": 1}
-            doctype = "Website Item"
-            fields = [
-                "name", "item_code", "item_name", "web_item_name",
-                "short_description", "website_image", "route",
-                "website_warehouse", "on_backorder"
-            ]
-        else:
-            doctype = "Item"
-            base_filters["show_in_website"] = 1
-            fields = [
-                "name", "item_code", "item_name", "description", "image"
-            ]
+        sort_value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return sort_value, name
+    except Exception:
+        return None
 
-        # Apply custom filters
-        if filters:
-            if filters.get('item_group'):
-                base_filters['item_group'] = filters.get('item_group')
+def get_all_products(filters=None, limit=20, offset=0, sort_by="modified", sort_order="desc", after=None):
+    """Get all products with filters for shop page.
 
-        products = frappe.get_all(
-            doctype,
-            filters=base_filters,
-            fields=fields,
-            order_by=f"{sort_by} {sort_order}",
-            limit_start=offset,
-            limit_page_length=limit
-        )
+    `sort_by` may be "creation", "modified", "item_name" or "price". Pass
+    `after` (the `cursor` of the last product of the previous page) to
+    continue with keyset pagination instead of `offset`.
+    """
+    from frappe.query_builder import Order
 
-        for product in products:
-            if doctype == "Website Item":
-                product.slug = product.route or product.item_code
-                product.name = product.web_item_name or product.item_name
-                # Get image from Website Item, fallback to Item image
-                product.image = product.website_image
-                if not product.image:
-                    item_image = frappe.db.get_value("Item", product.item_code, "image")
-                    product.image = item_image
-                # Check stock if warehouse is specified
-                product.out_of_stock = False
-                if product.get('website_warehouse'):
-                    product.out_of_stock = not has_stock(product.item_code, product.website_warehouse)
-                elif product.get('on_backorder'):
-                    product.out_of_stock = False  # Allow backorders
+    try:
+        table, query = _get_product_query(filters)
+
+        sort_columns = {
+            "creation": "source_creation",
+            "modified": "source_modified",
+            "item_name": "item_name",
+            "price": "price"
+        }
+        order = Order.asc if sort_order == "asc" else Order.desc
+        sort_field = table[sort_columns.get(sort_by, "source_modified")]
+
+        # Keyset pagination: continue right after the cursor row
+        cursor = decode_product_cursor(after) if after else None
+        if cursor:
+            sort_value, name = cursor
+            if order == Order.asc:
+                query = query.where((sort_field > sort_value) | ((sort_field == sort_value) & (table.name > name)))
             else:
-                product.slug = product.item_code
-                product.name = product.item_name
-                product.out_of_stock = not has_stock(product.item_code)
-
-            price_info = get_item_price(product.item_code)
-            product.price = price_info.get('price', 0)
-            product.formatted_price = price_info.get('formatted_price', '€0.00')
-
-        # Apply price filter client-side friendly
-        if filters:
-            price_min = filters.get('price_min')
-            price_max = filters.get('price_max')
-            if price_min:
-                products = [p for p in products if p.price >= float(price_min)]
-            if price_max:
-                products = [p for p in products if p.price <= float(price_max)]
+                query = query.where((sort_field < sort_value) | ((sort_field == sort_value) & (table.name < name)))
+            offset = 0
+
+        products = (
+            query.select(
+                table.name, table.item_code, table.slug, table.display_name, table.short_description,
+                table.image, table.price, table.formatted_price, table.in_stock,
+                sort_field.as_("sort_value")
+            )
+            .orderby(sort_field, order=order)
+            .orderby(table.name, order=order)
+            .limit(limit)
+            .offset(offset)
+        ).run(as_dict=True)
+
+        for product in products:
+            product.cursor = encode_product_cursor(product.pop("sort_value"), product.name)
+            _card_to_product(product)
 
         return products
 
@@ -287,41 +354,28 @@ def get_all_products(filters=None, limit=20, offset=0, sort_by="modified", sort_
 def get_product_by_slug(slug):
     """Get single product by slug/route"""
     try:
-        if frappe.db.exists("DocType", "Website Item"):
-            product = frappe.get_doc("Website Item", {"route": slug})
-            # Check stock availability
-            out_of_stock = False
-            if product.website_warehouse:
-                out_of_stock = not has_stock(product.item_code, product.website_warehouse)
-
+        product = frappe.db.get_value(
+            "Garval Product Card",
+            {"slug": slug},
+            [
+                "item_code", "website_item", "display_name", "short_description", "description",
+                "image", "price", "formatted_price", "in_stock", "stock_uom"
+            ],
+            as_dict=True
+        )
+        if product:
             return {
                 "item_code": product.item_code,
-                "name": product.web_item_name or product.item_name,
-                "description": product.web_long_description or product.short_description,
+                "name": product.display_name,
+                "description": product.description,
                 "short_description": product.short_description,
-                "image": product.website_image,
-                "images": get_product_images(product.name, "Website Item"),
-                "price": get_item_price(product.item_code).get('price', 0),
-                "formatted_price": get_item_price(product.item_code).get('formatted_price', format_currency(0)),
-                "out_of_stock": out_of_stock,
+                "image": product.image,
+                "images": get_product_images(product.website_item, "Website Item") if product.website_item else [],
+                "price": float(product.price or 0),
+                "formatted_price": product.formatted_price,
+                "out_of_stock": not product.in_stock,
                 "uom": product.stock_uom
             }
-        else:
-            # Try by item_code
-            if frappe.db.exists("Item", slug):
-                product = frappe.get_doc("Item", slug)
-                return {
-                    "item_code": product.item_code,
-                    "name": product.item_name,
-                    "description": product.description,
-                    "short_description": product.description[:200] if product.description else "",
-                    "image": product.image,
-                    "images": [],
-                    "price": get_item_price(product.item_code).get('price', 0),
-                    "formatted_price": get_item_price(product.item_code).get('formatted_price', format_currency(0)),
-                    "out_of_stock": not has_stock(product.item_code),
-                    "uom": product.stock_uom
-                }
     except Exception as e:
         frappe.log_error(f"Error fetching product {slug}: {str(e)}")
 
@@ -373,13 +427,6 @@ def send_bank_transfer_invoice_email(sales_invoice, sales_order, customer_email,
             if swift:
                 bank_details["swift_number"] = swift
         
-        # Generate invoice PDF
-        invoice_pdf = frappe.attach_print(
-            "Sales Invoice",
-            sales_invoice.name,
-            print_format="Standard"
-        )
-        
         # Get email template from Payment Gateway Account message field
         email_template_content = payment_gateway_account.message or ""
         
@@ -392,18 +439,19 @@ def send_bank_transfer_invoice_email(sales_invoice, sales_order, customer_email,
         # Email subject
         subject = getattr(payment_gateway_account, "subject", None) or _("Invoice pending for {0}").format(sales_order)
         
-        # Send email with rendered content
-        frappe.sendmail(
+        # Queue email with rendered content
+        from garval_store.emails import send_email
+        send_email(
             recipients=[customer_email],
             subject=subject,
-            content=rendered_content,
-            attachments=[invoice_pdf],
+            message=rendered_content,
+            # Invoice PDF from the PDF cache, rendered in the background if needed
+            print_attachments=[("Sales Invoice", sales_invoice.name, "Standard")],
             reference_doctype="Sales Invoice",
-            reference_name=sales_invoice.name,
-            now=True
+            reference_name=sales_invoice.name
         )
         
-        frappe.log_error(f"Bank transfer invoice email sent to {customer_email} for invoice {sales_invoice.name}", "Bank Transfer Email")
+        frappe.log_error(f"Bank transfer invoice email queued for {customer_email} for invoice {sales_invoice.name}", "Bank Transfer Email")
         return True
         
     except Exception as e:
@@ -430,49 +478,128 @@ def get_product_images(doc_name, doctype="Website Item"):
         pass
     return images
 
+def get_default_price_list():
+    """Get the selling price list used for the webshop"""
+    return get_store_settings().selling_price_list
+
+def get_item_prices(item_codes, price_list=None):
+    """Get prices for several items from ERPNext Price List in one query.
+
+    Returns a dict keyed by item_code with `price` and `formatted_price`.
+    Every requested item gets an entry; items without a price get 0.
+    """
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    symbol = get_currency_symbol()
+    rates = {}
+
+    if item_codes:
+        try:
+            if not price_list:
+                price_list = get_default_price_list()
+
+            item_prices = frappe.get_all(
+                "Item Price",
+                filters={
+                    "item_code": ["in", item_codes],
+                    "price_list": price_list,
+                    "selling": 1
+                },
+                fields=["item_code", "price_list_rate"]
+            )
+            for row in item_prices:
+                rates.setdefault(row.item_code, row.price_list_rate)
+        except Exception as e:
+            frappe.log_error(f"Error getting prices for {item_codes}: {str(e)}")
+
+    prices = {}
+    for item_code in item_codes:
+        price = float(rates.get(item_code) or 0)
+        prices[item_code] = {
+            "price": price,
+            "formatted_price": format_currency(price, symbol=symbol)
+        }
+    return prices
+
 def get_item_price(item_code, price_list=None):
     """Get item price from ERPNext Price List"""
-    try:
-        if not price_list:
-            price_list = frappe.db.get_single_value("Selling Settings", "selling_price_list")
-
-        if not price_list:
-            price_list = frappe.db.get_value("Price List", {"selling": 1, "enabled": 1}, "name")
+    prices = get_item_prices([item_code], price_list=price_list)
+    return prices.get(item_code) or {"price": 0, "formatted_price": format_currency(0)}
 
-        price = frappe.db.get_value(
-            "Item Price",
-            {"item_code": item_code, "price_list": price_list, "selling": 1},
-            "price_list_rate"
-        )
+def get_bin_qty(item_warehouses):
+    """Get stock levels for (item_code, warehouse) pairs from Bin in one query.
 
-        if price:
-            company = frappe.db.get_single_value("Global Defaults", "default_company")
-            return {
-                "price": float(price),
-                "formatted_price": format_currency(price, company)
+    Returns a dict keyed by (item_code, warehouse) with `actual_qty` and
+    `projected_qty`. Pairs without a Bin row have no stock.
+    """
+    pairs = {(item_code, warehouse) for item_code, warehouse in item_warehouses if item_code and warehouse}
+    levels = {pair: {"actual_qty": 0.0, "projected_qty": 0.0} for pair in pairs}
+
+    if not pairs:
+        return levels
+
+    bins = frappe.get_all(
+        "Bin",
+        filters={
+            "item_code": ["in", list({item_code for item_code, _warehouse in pairs})],
+            "warehouse": ["in", list({warehouse for _item_code, warehouse in pairs})]
+        },
+        fields=["item_code", "warehouse", "actual_qty", "projected_qty"]
+    )
+    for row in bins:
+        pair = (row.item_code, row.warehouse)
+        if pair in levels:
+            levels[pair] = {
+                "actual_qty": float(row.actual_qty or 0),
+                "projected_qty": float(row.projected_qty or 0)
             }
-    except Exception as e:
-        frappe.log_error(f"Error getting price for {item_code}: {str(e)}")
 
-    company = frappe.db.get_single_value("Global Defaults", "default_company")
-    return {"price": 0, "formatted_price": format_currency(0, company)}
+    return levels
 
-def has_stock(item_code, warehouse=None):
-    """Check if item has stock"""
-    try:
-        from erpnext.stock.utils import get_stock_balance
+def get_stock_availability(products, default_warehouse=None):
+    """Get stock availability for several products at once.
 
-        if not warehouse:
-            warehouse = frappe.db.get_single_value("Stock Settings", "default_warehouse")
+    Each product is a dict with `item_code` and optionally `website_warehouse`
+    and `on_backorder` (as on Website Item). Stock is checked in the website
+    warehouse, falling back to the Stock Settings default warehouse. Items on
+    backorder, or with no warehouse to check, are always available.
 
-        if warehouse:
-            qty = get_stock_balance(item_code, warehouse)
-            return qty > 0
-    except:
-        pass
+    Returns a dict keyed by item_code with `warehouse`, `actual_qty`,
+    `projected_qty` and `in_stock`.
+    """
+    if not default_warehouse:
+        default_warehouse = get_store_settings().default_warehouse
+
+    warehouses = {}
+    for product in products:
+        item_code = product.get("item_code")
+        if item_code:
+            warehouses[item_code] = (product.get("website_warehouse") or default_warehouse, product.get("on_backorder"))
+
+    try:
+        levels = get_bin_qty((item_code, warehouse) for item_code, (warehouse, _backorder) in warehouses.items())
+    except Exception as e:
+        frappe.log_error(f"Error getting stock levels: {str(e)}")
+        levels = {}
+
+    availability = {}
+    for item_code, (warehouse, on_backorder) in warehouses.items():
+        level = levels.get((item_code, warehouse))
+        availability[item_code] = frappe._dict({
+            "warehouse": warehouse,
+            "actual_qty": level["actual_qty"] if level else None,
+            "projected_qty": level["projected_qty"] if level else None,
+            # Default to available if stock can't be checked
+            "in_stock": bool(on_backorder or not level or level["actual_qty"] > 0)
+        })
 
-    return True  # Default to available if can't check
+    return availability
+
+def has_stock(item_code, warehouse=None):
+    """Check if item has stock"""
+    availability = get_stock_availability([{"item_code": item_code, "website_warehouse": warehouse}])
+    return availability[item_code].in_stock
 
+@cached("item_groups", ttl=3600)
 def get_item_groups():
     """Get item groups for filtering"""
     try:
@@ -487,27 +614,9 @@ def get_item_groups():
         return []
 
 def get_customer_from_user(user=None):
-    """Get ERPNext Customer linked to user"""
-    if not user:
-        user = frappe.session.user
-
-    if user == "Guest":
-        return None
-
-    customer = frappe.db.get_value("Customer", {"email_id": user}, "name")
-    if not customer:
-        # Check contact
-        contact = frappe.db.get_value("Contact", {"user": user}, "name")
-        if contact:
-            links = frappe.get_all(
-                "Dynamic Link",
-                filters={"parent": contact, "link_doctype": "Customer"},
-                fields=["link_name"]
-            )
-            if links:
-                customer = links[0].link_name
-
-    return customer
+    """Get ERPNext Customer linked to user (from the cached commerce context)"""
+    from garval_store.commerce_context import get_commerce_context
+    return get_commerce_context(user).customer
 
 def get_customer_orders(customer, limit=10):
     """Get customer's sales orders - exclude cancelled orders"""
@@ -561,8 +670,8 @@ def create_customer_from_signup(data):
             "doctype": "Customer",
             "customer_name": data.get("full_name"),
             "customer_type": "Individual",
-            "customer_group": frappe.db.get_single_value("Selling Settings", "customer_group") or "Individual",
-            "territory": frappe.db.get_single_value("Selling Settings", "territory") or "All Territories",
+            "customer_group": get_store_settings().customer_group,
+            "territory": get_store_settings().territory,
             "email_id": data.get("email")
         })
         customer.insert(ignore_permissions=True)
@@ -598,6 +707,7 @@ def create_customer_from_signup(data):
         frappe.log_error(f"Error creating customer: {str(e)}")
         return {"success": False, "error": str(e)}
 
+@cached("payment_gateways", ttl=3600)
 def get_payment_gateways():
     """Get all enabled payment gateway accounts"""
     try:
@@ -620,6 +730,97 @@ def get_payment_gateways():
         frappe.log_error(f"Error fetching payment gateways: {str(e)}")
         return []
 
+# Maximum quantity per item (prevent unrealistic orders)
+MAX_QUANTITY_PER_ITEM = 100
+
+def load_cart_items(item_codes):
+    """Load what cart validation needs for several items in a few set-based queries.
+
+    Returns a dict keyed by item_code with the Item fields plus `is_published`,
+    `on_backorder`, `rate`, `formatted_price` and `stock` (see
+    get_stock_availability). Items that don't exist are left out.
+    """
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    if not item_codes:
+        return {}
+
+    items = frappe.get_all(
+        "Item",
+        filters={"name": ["in", item_codes]},
+        fields=[
+            "name", "item_name", "disabled", "is_sales_item", "has_variants",
+            "show_in_website", "weight_per_unit", "weight_uom"
+        ]
+    )
+
+    web_items = {}
+    if frappe.db.exists("DocType", "Website Item"):
+        for web_item in frappe.get_all(
+            "Website Item",
+            filters={"item_code": ["in", item_codes], "published": 1},
+            fields=["item_code", "website_warehouse", "on_backorder"]
+        ):
+            web_items[web_item.item_code] = web_item
+
+    prices = get_item_prices([item.name for item in items])
+    stock = get_stock_availability([web_items.get(item.name) or {"item_code": item.name} for item in items])
+
+    cart_items = {}
+    for item in items:
+        web_item = web_items.get(item.name)
+        item.update({
+            "is_published": bool(web_item or item.show_in_website),
+            "on_backorder": web_item.on_backorder if web_item else 0,
+            "rate": prices[item.name]["price"],
+            "formatted_price": prices[item.name]["formatted_price"],
+            "stock": stock[item.name]
+        })
+        cart_items[item.name] = item
+
+    return cart_items
+
+def validate_cart_line(item_code, qty, cart_item):
+    """Validate one cart line against data from load_cart_items.
+
+    Returns the error message for the first failed check, or None if the line is valid.
+    """
+    # 1. Validate item exists and is enabled
+    if not cart_item:
+        return _("Item {0} not found").format(item_code)
+
+    if cart_item.disabled:
+        return _("Item {0} is not available").format(cart_item.item_name)
+
+    if not cart_item.is_sales_item:
+        return _("Item {0} is not for sale").format(cart_item.item_name)
+
+    if cart_item.has_variants:
+        return _("Please select a variant for {0}").format(cart_item.item_name)
+
+    # 2. Check if item is published on website (Website Item or show_in_website)
+    if not cart_item.is_published:
+        return _("Item {0} is not available for online purchase").format(cart_item.item_name)
+
+    # 3. Validate quantity
+    if qty <= 0:
+        return _("Invalid quantity for {0}").format(cart_item.item_name)
+
+    if qty > MAX_QUANTITY_PER_ITEM:
+        return _("Maximum quantity for {0} is {1}").format(cart_item.item_name, MAX_QUANTITY_PER_ITEM)
+
+    # 4. Check stock availability (skipped for backorders and items without a warehouse)
+    available_stock = cart_item.stock.actual_qty
+    if available_stock is not None and not cart_item.on_backorder and available_stock < qty:
+        if available_stock <= 0:
+            return _("Item {0} is out of stock").format(cart_item.item_name)
+        return _("Only {0} units of {1} available").format(int(available_stock), cart_item.item_name)
+
+    # 5. Get price from server (NEVER trust client price)
+    if cart_item.rate <= 0:
+        return _("Price not available for {0}").format(cart_item.item_name)
+
+    return None
+
 def create_sales_order_from_cart(cart_data, customer_info):
     """Create ERPNext Sales Order from cart"""
     try:
@@ -632,8 +833,8 @@ def create_sales_order_from_cart(cart_data, customer_info):
             }
 
         # Check if user's email is verified
-        email_verified = frappe.db.get_value("User", frappe.session.user, "email_verified")
-        if not email_verified:
+        from garval_store.commerce_context import get_commerce_context
+        if not get_commerce_context().email_verified:
             return {
                 "success": False,
                 "error": _("Please verify your email before placing an order. Check your inbox for the verification link."),
@@ -641,95 +842,30 @@ def create_sales_order_from_cart(cart_data, customer_info):
             }
 
         # Get company
-        company = frappe.db.get_single_value("Global Defaults", "default_company")
-        if not company:
-            company = frappe.get_all("Company", limit=1)[0].name
+        company = get_store_settings().company
 
         # Validate and process cart items BEFORE creating Sales Order
         from frappe.utils import flt
         validated_items = []
         validation_errors = []
 
-        # Get default warehouse for stock check
-        default_warehouse = frappe.db.get_single_value("Stock Settings", "default_warehouse")
-
-        # Maximum quantity per item (prevent unrealistic orders)
-        MAX_QUANTITY_PER_ITEM = 100
-
-        for item in cart_data.get("items", []):
-            item_code = item.get("id") or item.get("item_code")
-            if not item_code:
-                continue
-
-            # 1. Validate item exists and is enabled
-            item_data = frappe.db.get_value(
-                "Item",
-                item_code,
-                ["name", "item_name", "disabled", "is_sales_item", "has_variants"],
-                as_dict=True
-            )
-
-            if not item_data:
-                validation_errors.append(_("Item {0} not found").format(item_code))
-                continue
-
-            if item_data.disabled:
-                validation_errors.append(_("Item {0} is not available").format(item_data.item_name))
-                continue
-
-            if not item_data.is_sales_item:
-                validation_errors.append(_("Item {0} is not for sale").format(item_data.item_name))
-                continue
-
-            if item_data.has_variants:
-                validation_errors.append(_("Please select a variant for {0}").format(item_data.item_name))
-                continue
-
-            # 2. Check if item is published on website (Website Item or show_in_website)
-            is_published = frappe.db.exists("Website Item", {"item_code": item_code, "published": 1})
-            if not is_published:
-                is_published = frappe.db.get_value("Item", item_code, "show_in_website")
-
-            if not is_published:
-                validation_errors.append(_("Item {0} is not available for online purchase").format(item_data.item_name))
-                continue
-
-            # 3. Validate quantity
-            qty = flt(item.get("quantity", 1))
-            if qty <= 0:
-                validation_errors.append(_("Invalid quantity for {0}").format(item_data.item_name))
-                continue
-
-            if qty > MAX_QUANTITY_PER_ITEM:
-                validation_errors.append(_("Maximum quantity for {0} is {1}").format(item_data.item_name, MAX_QUANTITY_PER_ITEM))
-                continue
-
-            # 4. Check stock availability
-            if default_warehouse:
-                try:
-                    from erpnext.stock.utils import get_stock_balance
-                    available_stock = get_stock_balance(item_code, default_warehouse)
-                    if available_stock < qty:
-                        if available_stock <= 0:
-                            validation_errors.append(_("Item {0} is out of stock").format(item_data.item_name))
-                        else:
-                            validation_errors.append(_("Only {0} units of {1} available").format(int(available_stock), item_data.item_name))
-                        continue
-                except Exception:
-                    pass  # Continue if stock check fails (item might not be stock tracked)
-
-            # 5. Get price from server (NEVER trust client price)
-            server_price = get_item_price(item_code)
-            rate = server_price.get("price", 0)
-
-            if rate <= 0:
-                validation_errors.append(_("Price not available for {0}").format(item_data.item_name))
+        cart_lines = [
+            (item.get("id") or item.get("item_code"), flt(item.get("quantity", 1)))
+            for item in cart_data.get("items", [])
+        ]
+        cart_lines = [(item_code, qty) for item_code, qty in cart_lines if item_code]
+        cart_items = load_cart_items([item_code for item_code, _qty in cart_lines])
+
+        for item_code, qty in cart_lines:
+            error = validate_cart_line(item_code, qty, cart_items.get(item_code))
+            if error:
+                validation_errors.append(error)
                 continue
 
             validated_items.append({
                 "item_code": item_code,
                 "qty": qty,
-                "rate": rate
+                "rate": cart_items[item_code].rate
             })
 
         # Check if we have any valid items
@@ -766,8 +902,13 @@ def create_sales_order_from_cart(cart_data, customer_info):
             so.append("items", item)
 
         # Add shipping address if provided
+        destination = None
         if customer_info.get("selected_address"):
-            # Use existing address
+            # Use existing address, which must be one of the customer's
+            from garval_store.commerce_context import get_customer_address
+            destination = get_customer_address(customer_info.get("selected_address"), customer)
+            if not destination:
+                return {"success": False, "error": _("Please select a valid shipping address")}
             so.shipping_address_name = customer_info.get("selected_address")
         elif customer_info.get("address"):
             # Fallback: Create address from form fields (legacy support)
@@ -786,17 +927,20 @@ def create_sales_order_from_cart(cart_data, customer_info):
             })
             address.insert(ignore_permissions=True)
             so.shipping_address_name = address.name
+            destination = address
+
+        # Shipping rate for the address and cart weight, as shown at checkout
+        shipping_rate = None
+        if destination and destination.country:
+            from garval_store.shipping import get_cart_weight, get_rates, select_rate
+            weight = get_cart_weight([(item["item_code"], item["qty"]) for item in validated_items], cart_items)
+            shipping_rate = select_rate(
+                get_rates(destination.country, destination.pincode, weight),
+                customer_info.get("shipping_service")
+            )
 
         # Apply taxes template to Sales Order
-        tax_template_name = frappe.db.get_value(
-            "Sales Taxes and Charges Template",
-            {
-                "company": company,
-                "disabled": 0
-            },
-            "name",
-            order_by="is_default desc, creation desc"
-        )
+        tax_template_name = get_default_tax_template(company)
         
         if tax_template_name:
             so.taxes_and_charges = tax_template_name
@@ -807,6 +951,10 @@ def create_sales_order_from_cart(cart_data, customer_info):
                 so.set("taxes", [])
                 for tax_row in taxes_list:
                     so.append("taxes", tax_row)
+
+        rules = get_tax_rules(company)
+        if shipping_rate and can_charge_shipping_rate(rules, shipping_rate):
+            set_order_shipping(so, shipping_rate, rules)
         
         # Calculate totals (this will calculate taxes and grand total)
         so.calculate_taxes_and_totals()
@@ -814,164 +962,14 @@ def create_sales_order_from_cart(cart_data, customer_info):
         so.insert(ignore_permissions=True)
         so.submit()
 
-        # Create Payment Request if payment gateway is provided
-        payment_url = None
+        # Invoice and Payment Request are created by a background job once the
+        # order is committed; the browser polls get_order_status for the payment URL
         payment_gateway = customer_info.get("payment_method")
+        payment_pending = bool(payment_gateway and payment_gateway != "Manual")
 
-        if payment_gateway and payment_gateway != "Manual":
-            si_doc = None
-            try:
-                # Step 1: Create Sales Invoice from Sales Order (Proper ERPNext flow)
-                # This is EXACTLY how UI does it
-                from erpnext.selling.doctype.sales_order.sales_order import make_sales_invoice
-                si_doc = make_sales_invoice(so.name, ignore_permissions=True)
-                
-                # Ensure set_missing_values and calculate_taxes_and_totals are called (like UI does)
-                si_doc.run_method("set_missing_values")
-                si_doc.run_method("calculate_taxes_and_totals")
-                
-                si_doc.insert(ignore_permissions=True)
-                si_doc.flags.ignore_permissions = True
-                si_doc.submit()
-                
-                # Reload to get correct outstanding_amount after submit
-                si_doc.reload()
-                
-                # Get payment gateway account
-                payment_gateway_account = frappe.get_doc("Payment Gateway Account", payment_gateway)
-
-                # Check if Payment Gateway has a controller (Bank Transfer doesn't)
-                pg_controller = frappe.db.get_value("Payment Gateway", payment_gateway_account.payment_gateway, "gateway_controller")
-                is_bank_transfer = not pg_controller or "Bank Transfer" in str(payment_gateway_account.payment_gateway)
-                
-                # For Bank Transfer: Create Payment Request
-                if is_bank_transfer:
-                    # Get first enabled bank account for company (don't check is_company_account)
-                    bank_account = frappe.db.get_value(
-                        "Bank Account",
-                        {"company": company, "disabled": 0},
-                        "name",
-                        order_by="is_default desc, creation desc"
-                    )
-                    
-                    if not bank_account:
-                        frappe.throw(_("No company bank account found for Bank Transfer. Please configure one."))
-                    
-                    # Create Payment Request from Sales Invoice
-                    # Use outstanding_amount instead of grand_total for Payment Request
-                    # Get message and subject from Payment Gateway Account (like UI does)
-                    pr_message = payment_gateway_account.message or _("Payment request for invoice {0}").format(si_doc.name)
-                    pr_subject = getattr(payment_gateway_account, "subject", None) or _("Invoice pending for {0}").format(so.name)
-                    
-                    pr = frappe.get_doc({
-                        "doctype": "Payment Request",
-                        "payment_gateway_account": payment_gateway_account.name,
-                        "payment_gateway": payment_gateway_account.payment_gateway,
-                        "payment_account": payment_gateway_account.payment_account,
-                        "currency": si_doc.currency,
-                        "grand_total": si_doc.outstanding_amount,
-                        "mode_of_payment": payment_gateway_account.payment_gateway,
-                        "email_to": customer_info.get("email"),
-                        "subject": pr_subject,
-                        "message": pr_message,
-                        "reference_doctype": "Sales Invoice",
-                        "reference_name": si_doc.name,
-                        "party_type": "Customer",
-                        "party": customer,
-                        "bank_account": bank_account
-                    })
-                    pr.insert(ignore_permissions=True)
-                    pr.submit()
-                    
-                    payment_url = None  # No payment URL for Bank Transfer
-                    
-                else:
-                    # For other payment gateways: Create Payment Request
-                    # Get or create Mode of Payment
-                    mode_of_payment = payment_gateway_account.payment_gateway
-                    if not frappe.db.exists("Mode of Payment", mode_of_payment):
-                        mop = frappe.get_doc({
-                            "doctype": "Mode of Payment",
-                            "mode_of_payment": mode_of_payment,
-                            "type": "General"
-                        })
-                        mop.insert(ignore_permissions=True)
-
-                    # Create Payment Request from Sales Invoice
-                    # Use outstanding_amount instead of grand_total for Payment Request
-                    # Get message and subject from Payment Gateway Account (like UI does)
-                    pr_message = payment_gateway_account.message or _("Payment request for invoice {0}").format(si_doc.name)
-                    pr_subject = getattr(payment_gateway_account, "subject", None) or _("Payment Request for {0}").format(si_doc.name)
-
-                    pr = frappe.get_doc({
-                        "doctype": "Payment Request",
-                        "payment_gateway_account": payment_gateway_account.name,
-                        "payment_gateway": payment_gateway_account.payment_gateway,
-                        "payment_account": payment_gateway_account.payment_account,
-                        "currency": payment_gateway_account.currency or si_doc.currency,
-                        "grand_total": si_doc.outstanding_amount,
-                        "mode_of_payment": mode_of_payment,
-                        "email_to": customer_info.get("email"),
-                        "subject": pr_subject,
-                        "message": pr_message,
-                        "reference_doctype": "Sales Invoice",
-                        "reference_name": si_doc.name,
-                        "party_type": "Customer",
-                        "party": customer,
-                        "mute_email": 1  # Don't send email, we're redirecting directly
-                    })
-                    pr.insert(ignore_permissions=True)
-                    pr.submit()
-                    
-                    # Generate payment URL
-                    payment_url = None
-                    try:
-                        pr.reload()
-                        payment_url = pr.payment_url
-                        if not payment_url:
-                            pr.set_payment_request_url()
-                            payment_url = pr.payment_url
-                    except Exception as url_error:
-                        frappe.log_error(f"Payment URL generation failed: {str(url_error)}", "Payment URL Error")
-                        payment_url = None
-
-            except Exception as e:
-                error_msg = f"Error creating payment request: {str(e)}\nTraceback: {frappe.get_traceback()}\nPayment Gateway: {payment_gateway}"
-                frappe.log_error(error_msg, "Payment Error")
-                
-                # Cancel Sales Invoice if it was created
-                if si_doc:
-                    try:
-                        si_doc.reload()
-                        if si_doc.docstatus == 1:  # If submitted
-                            si_doc.cancel()
-                            frappe.log_error(f"Cancelled Sales Invoice {si_doc.name} due to payment error", "Payment Error")
-                    except Exception as cancel_error:
-                        frappe.log_error(f"Error cancelling Sales Invoice: {str(cancel_error)}", "Payment Error")
-                
-                # Cancel Sales Order
-                try:
-                    so.reload()
-                    if so.docstatus == 1:  # If submitted
-                        so.cancel()
-                        frappe.log_error(f"Cancelled Sales Order {so.name} due to payment error", "Payment Error")
-                except Exception as cancel_error:
-                    frappe.log_error(f"Error cancelling Sales Order: {str(cancel_error)}", "Payment Error")
-                
-                frappe.db.rollback()
-                
-                # Return specific error message
-                error_detail = str(e)
-                if "Settings not found" in error_detail:
-                    return {
-                        "success": False,
-                        "error": _("Payment gateway configuration error. Please contact support.")
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "error": _("Failed to process payment: {0}").format(error_detail)
-                    }
+        if payment_pending:
+            from garval_store.order_pipeline import start_order_pipeline
+            start_order_pipeline(so.name, payment_gateway, customer_info.get("email"))
 
         frappe.db.commit()
 
@@ -979,7 +977,8 @@ def create_sales_order_from_cart(cart_data, customer_info):
             "success": True,
             "order_id": so.name,
             "order": so.as_dict(),
-            "payment_url": payment_url
+            "payment_url": None,
+            "payment_pending": payment_pending
         }
 
     except Exception as e:
@@ -987,87 +986,160 @@ def create_sales_order_from_cart(cart_data, customer_info):
         frappe.log_error(f"Error creating sales order: {str(e)}")
         return {"success": False, "error": str(e)}
 
-def calculate_taxes_and_charges(subtotal, company=None):
-    """Calculate taxes and charges for a given subtotal based on enabled tax template"""
-    try:
-        if not company:
-            company = frappe.db.get_single_value("Global Defaults", "default_company")
-            if not company:
-                company = frappe.get_all("Company", limit=1)[0].name
-
-        # Get enabled tax template for company
-        tax_template_name = frappe.db.get_value(
-            "Sales Taxes and Charges Template",
-            {
-                "company": company,
-                "disabled": 0
-            },
-            "name",
-            order_by="is_default desc, creation desc"
-        )
+def set_order_shipping(so, shipping_rate, rules):
+    """Charge a shipping rate on a Sales Order in place of the template's shipping charges"""
+    so.set("taxes", [tax for tax in so.get("taxes") if not is_shipping_charge(tax)])
+
+    if shipping_rate.get("shipping_rule"):
+        # ERPNext adds the rule's charge row for the order's address and weight
+        so.shipping_rule = shipping_rate["shipping_rule"]
+        so.apply_shipping_rule()
+    elif shipping_rate["price"]:
+        so.append("taxes", {
+            "charge_type": "Actual",
+            "account_head": next(rule["account_head"] for rule in rules["shipping"] if rule["account_head"]),
+            "description": shipping_rate["name"],
+            "tax_amount": shipping_rate["price"]
+        })
 
-        if not tax_template_name:
-            return {
-                "subtotal": subtotal,
-                "taxes": [],
-                "shipping": 0,
-                "total_taxes": 0,
-                "grand_total": subtotal
-            }
+@cached("tax_template", ttl=3600)
+def get_default_tax_template(company):
+    """Get the enabled Sales Taxes and Charges Template used for webshop orders"""
+    return frappe.db.get_value(
+        "Sales Taxes and Charges Template",
+        {
+            "company": company,
+            "disabled": 0
+        },
+        "name",
+        order_by="is_default desc, creation desc"
+    ) or ""
+
+@cached("social_login", ttl=3600)
+def get_google_login_provider():
+    """Get the enabled, fully configured Google Social Login Key, if any"""
+    from frappe.utils.oauth import get_oauth_keys
+    from frappe.utils.password import get_decrypted_password
+
+    providers = frappe.get_all(
+        "Social Login Key",
+        filters={"enable_social_login": 1},
+        fields=["name", "client_id", "base_url", "provider_name"],
+        ignore_permissions=True,
+    )
 
-        tax_template = frappe.get_doc("Sales Taxes and Charges Template", tax_template_name)
-        
-        taxes_breakdown = []
-        total_taxes = 0
-        shipping = 0
-
-        for tax in tax_template.taxes:
-            if tax.charge_type == "Actual":
-                # Fixed amount (e.g., shipping charges)
-                amount = tax.tax_amount or 0
-                # Check if this is shipping/delivery charge
-                is_shipping = "shipping" in (tax.description or "").lower() or "delivery" in (tax.description or "").lower()
-                
-                if is_shipping:
-                    # Don't add shipping to taxes array, handle separately
-                    shipping = amount
-                else:
-                    # Add other fixed charges to taxes
-                    taxes_breakdown.append({
-                        "description": tax.description or tax.account_head,
-                        "amount": amount,
-                        "type": "fixed"
-                    })
-                total_taxes += amount
-            elif tax.charge_type == "On Net Total":
-                # Percentage on net total (e.g., GST)
-                rate = tax.rate or 0
-                amount = subtotal * (rate / 100)
-                taxes_breakdown.append({
-                    "description": tax.description or tax.account_head,
-                    "amount": amount,
-                    "rate": rate,
-                    "type": "percentage"
+    for provider in providers:
+        if provider.provider_name and provider.provider_name.lower() == "google":
+            client_secret = get_decrypted_password("Social Login Key", provider.name, "client_secret", raise_exception=False)
+            if client_secret and provider.client_id and provider.base_url and get_oauth_keys(provider.name):
+                return {"name": provider.name, "provider_name": provider.provider_name}
+
+    return {}
+
+@cached("tax_template", ttl=3600)
+def get_tax_rules(company):
+    """Compile the company's default tax template into a list of tax rules.
+
+    Returns `taxes` (percentage and fixed rows, in template order) and
+    `shipping` (fixed rows whose description mentions shipping or delivery).
+    """
+    rules = {"template": get_default_tax_template(company), "taxes": [], "shipping": []}
+    if not rules["template"]:
+        return rules
+
+    rows = frappe.get_all(
+        "Sales Taxes and Charges",
+        filters={"parent": rules["template"], "parenttype": "Sales Taxes and Charges Template"},
+        fields=["charge_type", "description", "account_head", "rate", "tax_amount"],
+        order_by="idx"
+    )
+
+    for tax in rows:
+        description = tax.description or tax.account_head
+        if tax.charge_type == "Actual":
+            # Fixed amount; shipping/delivery charges are shown separately
+            if is_shipping_charge(tax):
+                rules["shipping"].append({
+                    "description": description,
+                    "amount": tax.tax_amount or 0,
+                    "account_head": tax.account_head
                 })
-                total_taxes += amount
+            else:
+                rules["taxes"].append({"description": description, "amount": tax.tax_amount or 0, "type": "fixed"})
+        elif tax.charge_type == "On Net Total":
+            # Percentage on net total (e.g., GST)
+            rules["taxes"].append({"description": description, "rate": tax.rate or 0, "type": "percentage"})
 
-        grand_total = subtotal + total_taxes
+    return rules
 
-        return {
-            "subtotal": subtotal,
-            "taxes": taxes_breakdown,
-            "shipping": shipping,
-            "total_taxes": total_taxes,
-            "grand_total": grand_total
-        }
+def is_shipping_charge(tax):
+    """Whether a tax row is a fixed shipping/delivery charge"""
+    text = (tax.get("description") or "").lower()
+    return tax.get("charge_type") == "Actual" and ("shipping" in text or "delivery" in text)
+
+def can_charge_shipping_rate(rules, shipping_rate):
+    """Whether orders can be charged a shipping rate: through its Shipping Rule or the template's shipping account"""
+    return bool(shipping_rate.get("shipping_rule") or any(rule["account_head"] for rule in rules["shipping"]))
+
+def apply_tax_rules(rules, subtotal, shipping_rate=None):
+    """Taxes and charges for a subtotal from compiled tax rules.
+
+    A chargeable `shipping_rate` (from garval_store.shipping) replaces the
+    template's shipping charges.
+    """
+    taxes_breakdown = []
+    total_taxes = 0
+
+    for rule in rules["taxes"]:
+        if rule["type"] == "percentage":
+            amount = subtotal * (rule["rate"] / 100)
+            taxes_breakdown.append({
+                "description": rule["description"],
+                "amount": amount,
+                "rate": rule["rate"],
+                "type": "percentage"
+            })
+        else:
+            amount = rule["amount"]
+            taxes_breakdown.append({
+                "description": rule["description"],
+                "amount": amount,
+                "type": "fixed"
+            })
+        total_taxes += amount
+
+    shipping = sum(rule["amount"] for rule in rules["shipping"])
+    if shipping_rate and can_charge_shipping_rate(rules, shipping_rate):
+        shipping = shipping_rate["price"]
+    total_taxes += shipping
+
+    return {
+        "subtotal": subtotal,
+        "taxes": taxes_breakdown,
+        "shipping": shipping,
+        "total_taxes": total_taxes,
+        "grand_total": subtotal + total_taxes
+    }
+
+def calculate_taxes_and_charges(subtotal, company=None, shipping_rate=None):
+    """Calculate taxes and charges for a given subtotal based on enabled tax template"""
+    return calculate_taxes_for_subtotals([subtotal], company=company, shipping_rate=shipping_rate)[0]
+
+def calculate_taxes_for_subtotals(subtotals, company=None, shipping_rate=None):
+    """Calculate taxes and charges for several subtotals with one lookup of the tax rules"""
+    try:
+        if not company:
+            company = get_store_settings().company
+        rules = get_tax_rules(company)
+        return [apply_tax_rules(rules, subtotal, shipping_rate) for subtotal in subtotals]
 
     except Exception as e:
         frappe.log_error(f"Error calculating taxes: {str(e)}")
         # Return subtotal only if calculation fails
-        return {
+        return [{
             "subtotal": subtotal,
             "taxes": [],
             "shipping": 0,
             "total_taxes": 0,
             "grand_total": subtotal
-        }
+        } for subtotal in subtotals]
@@ -1,4 +1,5 @@
 import frappe
+from garval_store.commerce_context import get_address_book
 from garval_store.utils import set_lang, get_customer_from_user, get_payment_gateways, get_currency_symbol
 
 def get_context(context):
@@ -13,14 +14,7 @@ def get_context(context):
         context.customer = frappe.get_doc("Customer", customer_name)
 
         # Get customer's saved addresses
-        context.addresses = frappe.get_all(
-            "Address",
-            filters={
-                "link_doctype": "Customer",
-                "link_name": customer_name
-            },
-            fields=["name", "address_title", "address_line1", "address_line2", "city", "state", "pincode", "country", "phone"]
-        )
+        context.addresses = get_address_book(customer_name)
     else:
         context.customer = None
         context.addresses = []
@@ -1,5 +1,5 @@
 import frappe
-from garval_store.utils import set_lang
+from garval_store.utils import set_lang, get_store_settings
 from frappe.contacts.doctype.address.address import render_address, get_address_display_list
 from frappe.contacts.doctype.contact.contact import get_contact_display_list
 
@@ -15,7 +15,7 @@ def get_context(context):
     
     # Get default company using Frappe ORM
     try:
-        default_company = frappe.db.get_single_value("Global Defaults", "default_company")
+        default_company = get_store_settings().company
         # Debug: Log the default company name
         if default_company:
             frappe.logger().debug(f"Contact page - Default company: {default_company}")
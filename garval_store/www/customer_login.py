@@ -1,7 +1,6 @@
 import frappe
-from garval_store.utils import set_lang
-from frappe.utils.oauth import get_oauth2_authorize_url, get_oauth_keys
-from frappe.utils.password import get_decrypted_password
+from garval_store.utils import set_lang, get_google_login_provider
+from frappe.utils.oauth import get_oauth2_authorize_url
 
 def get_context(context):
     """Context for login page"""
@@ -22,22 +21,12 @@ def get_context(context):
 
     # Get OAuth providers (Google)
     context["provider_logins"] = []
-    providers = frappe.get_all(
-        "Social Login Key",
-        filters={"enable_social_login": 1},
-        fields=["name", "client_id", "base_url", "provider_name"],
-        ignore_permissions=True,
-    )
-
-    for provider in providers:
-        if provider.provider_name and provider.provider_name.lower() == "google":
-            client_secret = get_decrypted_password("Social Login Key", provider.name, "client_secret", raise_exception=False)
-            if client_secret and provider.client_id and provider.base_url and get_oauth_keys(provider.name):
-                context["provider_logins"].append({
-                    "provider_name": provider.provider_name,
-                    "auth_url": get_oauth2_authorize_url(provider.name, redirect_to),
-                })
-                break
+    provider = get_google_login_provider()
+    if provider:
+        context["provider_logins"].append({
+            "provider_name": provider["provider_name"],
+            "auth_url": get_oauth2_authorize_url(provider["name"], redirect_to),
+        })
 
     context["redirect_to"] = redirect_to
     return context
@@ -1,5 +1,6 @@
 import frappe
-from garval_store.utils import set_lang, get_all_products, get_item_groups, get_currency_symbol
+from urllib.parse import urlencode
+from garval_store.utils import set_lang, get_all_products, count_products, get_item_groups, get_currency_symbol
 
 def get_context(context):
     """Context for shop page - pulls products from ERPNext Items"""
@@ -13,6 +14,8 @@ def get_context(context):
     price_max = frappe.request.args.get('price_max')
     item_group = frappe.request.args.get('category')
     page = int(frappe.request.args.get('page', 1))
+    # Cursor of the last product on the previous page (set by the "next" link)
+    after = frappe.request.args.get('after')
 
     # Pagination
     items_per_page = 12
@@ -41,19 +44,29 @@ def get_context(context):
         filters=filters,
         limit=items_per_page,
         offset=offset,
-        sort_by=sort_by if sort_by != 'price' else 'creation',
-        sort_order=sort_order if sort_by != 'price' else 'desc'
+        sort_by=sort_by,
+        sort_order=sort_order,
+        after=after
     )
-
-    # Sort by price if needed (since price might not be in the table)
-    if sort_by == 'price':
-        reverse = sort_order == 'desc'
-        products.sort(key=lambda x: x.get('price', 0), reverse=reverse)
+    next_cursor = products[-1].cursor if products else None
 
     # Get total count for pagination
-    total_products = len(get_all_products(filters=filters, limit=1000))
+    total_products = count_products(filters=filters)
     total_pages = (total_products + items_per_page - 1) // items_per_page
 
+    # Keep sort and filters on pagination links; "next" continues from the last product
+    page_args = {
+        'sort': frappe.request.args.get('sort'),
+        'price_min': price_min,
+        'price_max': price_max,
+        'category': item_group
+    }
+    page_query = urlencode({k: v for k, v in page_args.items() if v})
+    page_query = page_query + '&' if page_query else ''
+    next_page_url = f"?{page_query}page={page + 1}"
+    if next_cursor:
+        next_page_url += "&" + urlencode({'after': next_cursor})
+
     context.products = products
     context.item_groups = get_item_groups()
     context.sort = sort
@@ -62,5 +75,7 @@ def get_context(context):
     context.selected_category = item_group
     context.current_page = page
     context.total_pages = total_pages
+    context.page_query = page_query
+    context.next_page_url = next_page_url
 
     return context